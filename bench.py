@@ -0,0 +1,101 @@
+##### bench.py 对本地替身站点重复跑 greathost.py，统计各阶段 p50/p95 耗时与峰值内存 ######
+# 用法: python bench.py -n 10 --mode http --servers 5 --latency-ms 50
+#       python bench.py -n 20 --max-p95-ms 15000   # 作为性能回归门禁，超标时退出码为 1
+
+import os, sys, json, math, time, argparse, tempfile, subprocess
+import greathost_fake as fake
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def pct(vals, p):
+    if not vals: return 0
+    vals = sorted(vals)
+    return vals[max(0, math.ceil(p / 100 * len(vals)) - 1)]
+
+def tree_peaks(report):
+    # greathost 采样器记录的进程树峰值(含 chromedriver/Chrome)，按阶段路径的每一段归档；没装 psutil 时为 None
+    res = [sp for sp in report.get("spans", []) if sp["name"] == "resources"]
+    if not res: return None, 0
+    phases = {}
+    for sp in res:
+        for path, d in sp.get("phases", {}).items():
+            for name in path.split("/"): phases[name] = max(phases.get(name, 0), d.get("total", 0))
+    return phases, max(sp.get("peak_kb", {}).get("total", 0) for sp in res)
+
+def run_once(a, url, workdir, i):
+    mdir = os.path.join(workdir, f"run{i}")
+    env = {
+        **os.environ,
+        "GREATHOST_URL": url, "IP_URL": f"{url}/ip",
+        "GREATHOST_EMAIL": "bench@example.com", "GREATHOST_PASSWORD": "bench",
+        "TARGET_NAME": "*", "API_MODE": a.mode, "PROXY_URL": "",
+        "ACCOUNTS_FILE": "", "GREATHOST_ACCOUNTS": "",
+        "METRICS_DIR": mdir, "NOTIFY_SINKS": "jsonl", "NOTIFY_JSONL": os.path.join(workdir, "notices.jsonl"),
+        "README_FILE": os.path.join(workdir, "README.md"),
+        "SESSION_CACHE": os.path.join(workdir, "session.json") if a.keep_session else "",
+        # 状态短路会让冷却/上限之后的轮次直接退出、不写 metrics.json，压测必须每轮真跑
+        "COOLDOWN_FROM_API": "1" if a.expose_cooldown else "0",
+        "STATE_FILE": "", "FORCE_RUN": "1", "HISTORY_DB": os.path.join(mdir, "history.db"),
+    }
+    t0 = time.perf_counter()
+    p = subprocess.run([sys.executable, os.path.join(HERE, "greathost.py")], env=env, cwd=workdir,
+                       capture_output=not a.verbose, text=True)
+    wall = (time.perf_counter() - t0) * 1000
+    try:
+        with open(os.path.join(mdir, "metrics.json"), encoding="utf-8") as f: report = json.load(f)
+    except Exception:
+        report = {"spans": [], "results": [], "peak_rss_kb": 0}
+    return {"wall_ms": wall, "code": p.returncode, "report": report}
+
+def main():
+    p = fake.add_args(argparse.ArgumentParser(description="GreatHost 本地压测"))
+    p.add_argument("-n", "--runs", type=int, default=5)
+    p.add_argument("--mode", choices=["browser", "http"], default="browser")
+    p.add_argument("--keep-state", action="store_true", help="所有轮次共用同一站点状态 (会出现冷却/上限)")
+    p.add_argument("--keep-session", action="store_true", help="轮次之间保留登录态缓存")
+    p.add_argument("--max-p95-ms", type=float, default=0, help="整轮 p95 超过该值时退出码为 1")
+    p.add_argument("--json", help="把原始结果写入该文件")
+    p.add_argument("-v", "--verbose", action="store_true")
+    a = p.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="greathost-bench-")
+    httpd, url = fake.serve(fake.site_from_args(a))
+    runs = []
+    for i in range(a.runs):
+        if not a.keep_state and i:
+            httpd.shutdown(); httpd, url = fake.serve(fake.site_from_args(a))
+        r = run_once(a, url, workdir, i)
+        kinds = ",".join(x["kind"] for x in r["report"].get("results", [])) or f"exit={r['code']}"
+        print(f"#{i + 1:<3} {r['wall_ms']:8.0f} ms  {kinds}")
+        runs.append(r)
+    httpd.shutdown()
+
+    # 每轮内同名阶段先求和，再跨轮取分位数
+    # RSS 优先用进程树采样；否则退回 ru_maxrss，只含 Python 进程且是累计高水位
+    phases, tree = {}, any(tree_peaks(r["report"])[0] is not None for r in runs)
+    for r in runs:
+        per, (tp, _) = {}, tree_peaks(r["report"])
+        for sp in r["report"].get("spans", []):
+            if sp["name"] == "resources": continue
+            d = per.setdefault(sp["name"], {"ms": 0.0, "rss": 0})
+            d["ms"] += sp["ms"]; d["rss"] = max(d["rss"], (tp or {}).get(sp["name"], 0) if tree else sp.get("rss_kb", 0))
+        for k, d in per.items():
+            phases.setdefault(k, {"ms": [], "rss": []})
+            phases[k]["ms"].append(d["ms"]); phases[k]["rss"].append(d["rss"])
+    walls = [r["wall_ms"] for r in runs]
+    print(f"\n{'阶段':<14}{'p50 ms':>10}{'p95 ms':>10}{'峰值 RSS MB' if tree else '峰值 RSS MB(仅 Python)':>14}")
+    for k, d in phases.items():
+        # 阶段短于采样间隔时没有落到任何采样点，显示 - 而不是 0
+        rss = f"{max(d['rss']) / 1024:.1f}" if max(d["rss"]) else "-"
+        print(f"{k:<14}{pct(d['ms'], 50):>10.0f}{pct(d['ms'], 95):>10.0f}{rss:>14}")
+    peak = max([tree_peaks(r["report"])[1] if tree else r["report"].get("peak_rss_kb", 0) for r in runs] or [0])
+    print(f"{'整轮':<14}{pct(walls, 50):>10.0f}{pct(walls, 95):>10.0f}{peak / 1024:>14.1f}")
+
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f: json.dump(runs, f, ensure_ascii=False, indent=1)
+    if a.max_p95_ms and pct(walls, 95) > a.max_p95_ms:
+        print(f"❌ p95 {pct(walls, 95):.0f}ms 超过门限 {a.max_p95_ms:.0f}ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
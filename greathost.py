@@ -1,20 +1,83 @@
 ##### greathost.py api后台协议抓取，指定名续期 ######
 
-import os, re, time, json, requests
-from datetime import datetime, timezone
+import os, re, sys, time, json, heapq, queue, atexit, random, signal, socket, base64, hashlib, sqlite3, argparse, threading, requests
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlparse
 from zoneinfo import ZoneInfo
-from seleniumwire import webdriver
+from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
+API_RECORD_DIR = os.getenv("API_RECORD_DIR", "") #=====把脱敏后的 API 往来录制到该目录=====
+API_REPLAY_DIR = os.getenv("API_REPLAY_DIR", "") #=====从录制目录回放 API，不开浏览器也不联网=====
 EMAIL = os.getenv("GREATHOST_EMAIL", "")
 PASSWORD = os.getenv("GREATHOST_PASSWORD", "")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
+NOTIFY_SINKS = os.getenv("NOTIFY_SINKS", "jsonl" if API_REPLAY_DIR else "telegram,readme") #=====通知通道: telegram,readme,jsonl=====
+NOTIFY_DIGEST = os.getenv("NOTIFY_DIGEST", "1") == "1" #=====1: 每轮合并成一条摘要 / 0: 逐条发送=====
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", "3")) #=====单条通知最多重试次数=====
+NOTIFY_JSONL = os.getenv("NOTIFY_JSONL", "notices.jsonl")
+README_FILE = os.getenv("README_FILE", "README.md")
+METRICS_DIR = os.getenv("METRICS_DIR", "") #=====耗时指标输出目录(metrics.json + greathost.prom)，留空关闭=====
+STATE_FILE = os.getenv("STATE_FILE", ".greathost_state.json") #=====上次运行的到期/冷却状态，用于启动前短路，留空关闭=====
+FORCE_REFRESH_H = float(os.getenv("FORCE_REFRESH_H", "24")) #=====状态超过该小时数强制完整运行一次，0=不强制=====
+FORCE_RUN = os.getenv("FORCE_RUN", "0") == "1" #=====忽略状态文件，必定完整运行=====
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db") #=====运行历史 SQLite，留空关闭=====
+HISTORY_KEEP_DAYS = int(os.getenv("HISTORY_KEEP_DAYS", "180")) #=====历史保留天数=====
+RESOURCE_SAMPLE_S = float(os.getenv("RESOURCE_SAMPLE_S", "0.5")) #=====进程树资源采样间隔秒(需 psutil)，0=关闭=====
+STATUS_DIR = os.getenv("STATUS_DIR", "") #=====每轮结束写 status.json / status.prom 的目录，留空关闭=====
+STATUS_PORT = int(os.getenv("STATUS_PORT", "0")) #=====状态接口端口 (/status, /metrics)，0=关闭；serve 模式默认 9108=====
+STATUS_HOST = os.getenv("STATUS_HOST", "127.0.0.1") #=====状态接口监听地址=====
+METRICS_README = os.getenv("METRICS_README", "0") == "1" #=====README 末尾附耗时汇总表=====
 PROXY_URL = os.getenv("PROXY_URL", "") #=====sock5代理可留空=====
-TARGET_NAME = os.getenv("TARGET_NAME", "loveMC") #=====目标服务器名=====
+PROXY_POOL = os.getenv("PROXY_POOL", "") #=====代理池，逗号或换行分隔，优先于 PROXY_URL=====
+PROXY_POOL_FILE = os.getenv("PROXY_POOL_FILE", "proxies.txt") #=====代理池文件，每行一个=====
+PROXY_PROBE_CACHE = os.getenv("PROXY_PROBE_CACHE", ".proxy_probe.json") #=====代理探测结果缓存=====
+PROXY_PROBE_TTL_S = int(os.getenv("PROXY_PROBE_TTL_S", "600")) #=====探测结果有效秒数=====
+PROXY_PROBE_TIMEOUT = float(os.getenv("PROXY_PROBE_TIMEOUT", "8")) #=====单个代理探测超时=====
+PROXY_IP_CHECK = os.getenv("PROXY_IP_CHECK", "1") == "1" #=====续期前校验出口 IP 是否为代理地址=====
+TARGET_NAME = os.getenv("TARGET_NAME", "loveMC") #=====目标服务器名，逗号分隔多个，* 为全部=====
+ACCOUNTS_FILE = os.getenv("ACCOUNTS_FILE", "accounts.json") #=====多账号配置文件，存在时优先=====
+ACCOUNTS_JSON = os.getenv("GREATHOST_ACCOUNTS", "") #=====多账号配置 JSON，同 accounts.json 格式=====
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "3")) #=====同时处理的账号数=====
+COOLDOWN_FROM_API = os.getenv("COOLDOWN_FROM_API", "0") == "1" #=====按合同 JSON 的冷却字段判定、跳过合同页按钮；字段名为推测，默认关闭=====
+RENEW_COOLDOWN_MIN = int(os.getenv("RENEW_COOLDOWN_MIN", "0")) #=====免费续期冷却分钟数，0=不按上次续期时间推断=====
+MAXED_HOURS = int(os.getenv("MAXED_HOURS", "108")) #=====剩余超过该小时数视为已达上限=====
+DAEMON_MARGIN_S = int(os.getenv("DAEMON_MARGIN_S", "120")) #=====守护模式: 冷却结束后再等的安全余量=====
+DAEMON_JITTER_S = int(os.getenv("DAEMON_JITTER_S", "300")) #=====守护模式: 随机抖动上限=====
+DAEMON_MAX_SLEEP_H = float(os.getenv("DAEMON_MAX_SLEEP_H", "12")) #=====守护模式: 最长休眠，防止状态失真=====
+DAEMON_RETRY_MIN = int(os.getenv("DAEMON_RETRY_MIN", "30")) #=====守护模式: 出错后多久重试=====
+API_MODE = os.getenv("API_MODE", "browser").lower() #=====browser: 浏览器内 fetch / http: 登录后改用 requests 会话=====
+BASE_URL = os.getenv("GREATHOST_URL", "https://greathost.es").rstrip("/") #=====站点地址，压测时指向本地 greathost_fake.py=====
+WAIT_TIMEOUT = float(os.getenv("WAIT_TIMEOUT", "25")) #=====页面等待超时秒数=====
+RUN_DEADLINE_S = float(os.getenv("RUN_DEADLINE_S", "600")) #=====单个账号整轮最长秒数，重试都算在内=====
+IP_URL = os.getenv("IP_URL", "https://api.ipify.org?format=json") #=====出口 IP 查询地址=====
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES", "1") == "1" #=====拦截图片/字体/样式/第三方脚本等非必要请求=====
+BROWSER_MODE = os.getenv("BROWSER_MODE", "auto").lower() #=====auto: 无认证代理且不抓包时用原生 Chrome / wire: 强制 selenium-wire / native=====
+SHARED_BROWSER = os.getenv("SHARED_BROWSER", "0") == "1" #=====所有账号共用一个 Chrome，各自独立浏览器上下文(需原生 Chrome)=====
+CAPTURE = os.getenv("CAPTURE", "off").lower() #=====selenium-wire 抓包存储: off / memory=====
+CAPTURE_MAX = int(os.getenv("CAPTURE_MAX", "100")) #=====抓包最多保留条数=====
+CAPTURE_MAX_BODY = int(os.getenv("CAPTURE_MAX_BODY", "65536")) #=====单条抓包响应体上限字节=====
+ALLOW_HOSTS = os.getenv("ALLOW_HOSTS", "challenges.cloudflare.com,www.google.com,www.gstatic.com,hcaptcha.com") #=====额外放行的域名(验证码等)=====
+SESSION_CACHE = os.getenv("SESSION_CACHE", ".greathost_session.json") #=====登录态缓存文件，留空关闭=====
+SESSION_TTL_H = int(os.getenv("SESSION_TTL_H", "72")) #=====缓存最长有效小时数=====
 
 STATUS_MAP = {
     "running": ["🟢", "Running"],
@@ -27,185 +90,1592 @@ STATUS_MAP = {
 def now_shanghai():
     return datetime.now(ZoneInfo("Asia/Shanghai")).strftime('%Y/%m/%d %H:%M:%S')
 
+def parse_status(info):
+    st = (info.get("status") or "unknown").lower()
+    return STATUS_MAP.get(st, ["❓", st])
+
+def parse_renewal(data):
+    return data.get("contract", {}).get("renewalInfo") or data.get("renewalInfo", {})
+
+# renewalInfo 里"可能"出现的冷却字段，按优先级排列。这些字段名是推测的，没在真实 GreatHost 响应里见过，
+# 所以只有 COOLDOWN_FROM_API=1 才生效；可先用 API_RECORD_DIR 录一份真实合同确认后再打开
+COOLDOWN_KEYS = ("cooldownEndsAt", "cooldownUntil", "canRenewAt", "nextRenewalAvailableAt", "nextFreeRenewalAt")
+LAST_RENEW_KEYS = ("lastRenewalDate", "lastRenewedAt", "lastRenewal")
+WAIT_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+def parse_time(date_str):
+    if not date_str or not isinstance(date_str, str): return None
+    try:
+        clean = re.sub(r'\.\d+Z$', 'Z', date_str)
+        t = datetime.fromisoformat(clean.replace('Z', '+00:00'))
+        return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def resolve_cooldown(info):
+    # 返回 (能否续期, 冷却结束时间)，合同字段不够判断时返回 (None, None) 交给按钮兜底
+    now = datetime.now(timezone.utc)
+    until = next((t for t in map(parse_time, (info.get(k) for k in COOLDOWN_KEYS)) if t), None) if COOLDOWN_FROM_API else None
+    if until is None and RENEW_COOLDOWN_MIN:
+        last = next((t for t in map(parse_time, (info.get(k) for k in LAST_RENEW_KEYS)) if t), None)
+        if last: until = last + timedelta(minutes=RENEW_COOLDOWN_MIN)
+    if until: return until <= now, until
+    if COOLDOWN_FROM_API and info.get("canRenew") is True: return True, None
+    return None, None
+
+def parse_wait(btn):
+    m = re.search(r"Wait\s+(\d+)\s*([a-zA-Z]+)", btn)
+    unit = WAIT_UNITS.get(m.group(2)[0].lower()) if m else None
+    return datetime.now(timezone.utc) + timedelta(**{unit: int(m.group(1))}) if unit else None
+
+def fmt_wait(until):
+    mins = max(0, -int(-(until - datetime.now(timezone.utc)).total_seconds() // 60))
+    return f"{mins // 60}h {mins % 60}m" if mins >= 60 else f"{mins} 分钟"
+
 def calculate_hours(date_str):
     try:
         if not date_str: return 0
-        clean = re.sub(r'\.\d+Z$', 'Z', date_str)
-        expiry = datetime.fromisoformat(clean.replace('Z', '+00:00'))
+        expiry = parse_time(date_str)
+        if not expiry: raise ValueError(f"无法识别 {date_str!r}")
         diff = (expiry - datetime.now(timezone.utc)).total_seconds() / 3600
         return max(0, int(diff))
     except Exception as e:
         print(f"⚠️ 时间解析失败: {e}")
         return 0
 
-def send_notice(kind, fields):
-    titles = {
-        "renew_success": "🎉 <b>GreatHost 续期成功</b>",
-        "maxed_out": "🈵 <b>GreatHost 已达上限</b>",
-        "cooldown": "⏳ <b>GreatHost 还在冷却中</b>",
-        "renew_failed": "⚠️ <b>GreatHost 续期未生效</b>",
-        "error": "🚨 <b>GreatHost 脚本报错</b>"
-    }
-    body = "\n".join([f"{e} {k}: {v}" for e, k, v in fields])
-    msg = f"{titles.get(kind, '📢 通知')}\n\n{body}\n📅 时间: {now_shanghai()}"
-    
-    if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
+# 浏览器内 fetch，顺带带回状态码/字节数/耗时给指标层
+FETCH_JS = """
+const fetchInfo = async (path, method) => {
+  const s = performance.now();
+  try {
+    const r = await fetch(path, {method});
+    const text = await r.text();
+    let data;
+    try { data = JSON.parse(text); } catch (e) { data = {success: false, message: `HTTP ${r.status}: ${e}`}; }
+    return {path, method, data, status: r.status, bytes: text.length, ms: performance.now() - s};
+  } catch (e) {
+    return {path, method, data: {success: false, message: e.toString()}, status: 0, bytes: 0, ms: performance.now() - s};
+  }
+};
+"""
+
+API_JS = FETCH_JS + "fetchInfo(arguments[0], arguments[1]).then(arguments[arguments.length - 1]);"
+
+SNAPSHOT_JS = FETCH_JS + """
+const targets = arguments[0], done = arguments[arguments.length - 1], t0 = performance.now();
+(async () => {
+  const first = await fetchInfo('/api/servers', 'GET'), listing = first.data;
+  const servers = (listing.servers || []).filter(x => targets.includes('*') || targets.includes(x.name));
+  const got = await Promise.all(servers.flatMap(x => [
+    fetchInfo(`/api/servers/${x.id}/information`, 'GET'), fetchInfo(`/api/renewal/contracts/${x.id}`, 'GET')
+  ]));
+  const items = servers.map((x, i) => ({server: x, information: got[2 * i].data, contract: got[2 * i + 1].data}));
+  done({servers: listing, items, calls: [first, ...got], total: performance.now() - t0});
+})().catch(e => done({servers: {success: false, message: e.toString()}, items: [], calls: [], total: performance.now() - t0}));
+"""
+
+# 条件一成立就返回: DOM 变化 / popstate / pushState 时重新判断，不再每 500ms 轮询一次 WebDriver
+# 条件以数据传入，不用 new Function 拼代码，站点 CSP 禁止 unsafe-eval 时也能跑
+# {"selector": css} 元素出现 / {"selector": css, "text": true} 元素有文字 / {"path": s} 地址包含 s
+WAIT_JS = """
+const cond = arguments[0], timeout = arguments[1], done = arguments[arguments.length - 1];
+function check() {
+  if (cond.path) return location.pathname.includes(cond.path);
+  const el = document.querySelector(cond.selector);
+  if (!el) return null;
+  return cond.text ? el.textContent.trim() : el;
+}
+const t0 = performance.now();
+let finished = false, timer, obs;
+const pushState = history.pushState;
+const finish = (ok, value) => {
+  if (finished) return;
+  finished = true;
+  clearTimeout(timer); obs.disconnect(); history.pushState = pushState;
+  removeEventListener('popstate', test); removeEventListener('hashchange', test);
+  done({ok, value, ms: performance.now() - t0});
+};
+function test() { try { const v = check(); if (v) finish(true, v); } catch (e) {} }
+obs = new MutationObserver(test);
+obs.observe(document, {childList: true, subtree: true, characterData: true, attributes: true});
+addEventListener('popstate', test); addEventListener('hashchange', test);
+history.pushState = function () { pushState.apply(this, arguments); test(); };
+timer = setTimeout(() => finish(false, null), timeout);
+test();
+"""
+
+# ===== 步骤级重试: 每步 (最多次数, 初始退避秒)，指数退避 + 抖动，总时长受账号级 deadline 约束 =====
+RETRY_POLICY = {"login": (3, 3.0), "snapshot": (3, 1.0), "get_btn": (2, 1.0), "renew": (2, 2.0)}
+
+class RetryableError(Exception):
+    pass
+
+def retryable(e):
+    if "出口 IP 与代理不符" in str(e): return False
+    return isinstance(e, (RetryableError, TimeoutException, WebDriverException, requests.exceptions.RequestException)) or is_proxy_error(e)
+
+def bad_status(call):
+    return call["status"] in (0, 429) or call["status"] >= 500
+
+# ===== 耗时指标: 分阶段 span + 每次 API 调用，运行结束导出 JSON / Prometheus =====
+def path_tpl(url):
+    return re.sub(r"/[0-9a-f]{8}-[0-9a-f-]{27,}|/\d+(?=/|$)", "/{sid}", url.split("?")[0])
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock: self.spans, self.t0, self.active = [], time.time(), {}
+
+    def current(self, ident):
+        # 某线程当前所处的阶段，嵌套 span 用 / 连接，如 login/chrome_start
+        with self.lock: return "/".join(self.active.get(ident, []))
+
+    def record(self, name, ms, **labels):
+        with self.lock: self.spans.append({"name": name, "ms": round(ms, 1), "rss_kb": peak_rss_kb(), **labels})
+
+    @contextmanager
+    def span(self, name, **labels):
+        t0 = time.perf_counter()
+        with self.lock: stack = self.active.setdefault(threading.get_ident(), [])
+        stack.append(name)
+        try:
+            yield labels
+        except BaseException as e:
+            labels["error"] = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            self.record(name, (time.perf_counter() - t0) * 1000, **labels)
+
+    # 这些是附带记录而不是阶段，不计入阶段汇总
+    NOT_PHASES = ("api", "intercept", "resources")
+
+    def summary(self):
+        out = {}
+        with self.lock: spans = [sp for sp in self.spans if sp["name"] not in self.NOT_PHASES]
+        for sp in spans:
+            a = out.setdefault(sp["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            a["count"] += 1; a["total_ms"] += sp["ms"]; a["max_ms"] = max(a["max_ms"], sp["ms"])
+            a["errors"] += "error" in sp
+        return out
+
+    def table(self):
+        rows = [f"| {k} | {v['count']} | {v['total_ms']:.0f} | {v['max_ms']:.0f} |" for k, v in self.summary().items()]
+        return "| 阶段 | 次数 | 总耗时 ms | 最长 ms |\n|---|---|---|---|\n" + "\n".join(rows)
+
+    def prometheus(self, results):
+        lines = [
+            "# TYPE greathost_phase_duration_seconds summary",
+            *[f'greathost_phase_duration_seconds_sum{{phase="{k}"}} {v["total_ms"] / 1000:.3f}\n'
+              f'greathost_phase_duration_seconds_count{{phase="{k}"}} {v["count"]}' for k, v in self.summary().items()],
+        ]
+        api = {}
+        with self.lock: spans = [sp for sp in self.spans if sp["name"] == "api"]
+        for sp in spans:
+            k = (sp.get("method", "GET"), sp.get("path", ""), sp.get("status", 0))
+            n, b = api.get(k, (0, 0)); api[k] = (n + 1, b + sp.get("bytes", 0))
+        # 文本格式要求同一指标族的 TYPE 与样本连续成块，不能交错
+        lbls = {k: f'method="{k[0]}",path="{k[1]}",status="{k[2]}"' for k in api}
+        lines += ["# TYPE greathost_api_requests_total counter", *[f"greathost_api_requests_total{{{lbls[k]}}} {n}" for k, (n, b) in api.items()],
+                  "# TYPE greathost_api_response_bytes_total counter", *[f"greathost_api_response_bytes_total{{{lbls[k]}}} {b}" for k, (n, b) in api.items()]]
+        kinds = {}
+        for r in results: kinds[r["kind"]] = kinds.get(r["kind"], 0) + 1
+        lines += ["# TYPE greathost_run_results gauge", *[f'greathost_run_results{{kind="{k}"}} {v}' for k, v in kinds.items()],
+                  "# TYPE greathost_run_duration_seconds gauge", f"greathost_run_duration_seconds {time.time() - self.t0:.3f}",
+                  "# TYPE greathost_peak_rss_bytes gauge", f"greathost_peak_rss_bytes {peak_rss_kb() * 1024}",
+                  "# TYPE greathost_last_run_timestamp_seconds gauge", f"greathost_last_run_timestamp_seconds {int(time.time())}"]
+        with self.lock: res = [sp for sp in self.spans if sp["name"] == "resources"]
+        if res:
+            lines.append("# TYPE greathost_process_peak_rss_bytes gauge")
+            for group in ("python", "chromedriver", "chrome", "total"):
+                lines.append(f'greathost_process_peak_rss_bytes{{group="{group}"}} {max(sp["peak_kb"].get(group, 0) for sp in res) * 1024}')
+            lines += ["# TYPE greathost_chrome_leaked_processes gauge", f"greathost_chrome_leaked_processes {sum(sp['leaked'] for sp in res)}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, results):
+        if not METRICS_DIR: return
         try:
-            requests.post(
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with self.lock: spans = list(self.spans)
+            report = {"started": self.t0, "duration_s": round(time.time() - self.t0, 3), "peak_rss_kb": peak_rss_kb(),
+                      "phases": self.summary(), "spans": spans, "results": results}
+            with open(os.path.join(METRICS_DIR, "metrics.json"), "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=1, default=str)
+            # textfile collector 要求原子替换
+            prom = os.path.join(METRICS_DIR, "greathost.prom")
+            with open(f"{prom}.tmp", "w", encoding="utf-8") as f: f.write(self.prometheus(results))
+            os.replace(f"{prom}.tmp", prom)
+            print(f"📈 指标已写入 {METRICS_DIR}")
+        except Exception as e:
+            print(f"⚠️ 指标导出失败: {e}")
+
+METRICS = Metrics()
+
+class ResourceSampler:
+    # 后台定时采样本进程 + 本账号 chromedriver/Chrome 进程树，按采样时所处阶段记峰值
+    # selenium-wire 的 MITM 代理跑在本进程线程里，计入 python 一组
+    def __init__(self, gh):
+        self.gh, self.owner = gh, threading.get_ident()
+        self.lock, self.stopped = threading.Lock(), threading.Event()
+        self.peak, self.phases, self.cpu, self.chrome = {}, {}, {}, {}
+        self.max_threads = self.max_procs = 0
+        self.thread = threading.Thread(target=self._loop, name="gh-sampler", daemon=True)
+        self.thread.start()
+
+    def _tree(self):
+        groups = {"python": [psutil.Process()]}
+        pid = getattr(getattr(getattr(self.gh._d, "service", None), "process", None), "pid", None)
+        if pid:
+            try:
+                drv = psutil.Process(pid)
+                groups["chromedriver"], groups["chrome"] = [drv], drv.children(recursive=True)
+            except psutil.Error:
+                pass
+        return groups
+
+    def sample(self):
+        phase = METRICS.current(self.owner) or "idle"
+        rss, threads, procs = {}, 0, 0
+        for group, ps in self._tree().items():
+            for p in ps:
+                try:
+                    with p.oneshot():
+                        rss[group] = rss.get(group, 0) + p.memory_info().rss // 1024
+                        t = p.cpu_times()
+                        threads += p.num_threads()
+                except psutil.Error:
+                    continue
+                procs += 1
+                self.cpu[p.pid] = (group, t.user + t.system)
+                if group == "chrome": self.chrome[p.pid] = p
+        rss["total"] = sum(rss.values())
+        with self.lock:
+            ph = self.phases.setdefault(phase, {"samples": 0})
+            ph["samples"] += 1
+            for g, kb in rss.items():
+                self.peak[g] = max(self.peak.get(g, 0), kb)
+                ph[g] = max(ph.get(g, 0), kb)
+            self.max_threads, self.max_procs = max(self.max_threads, threads), max(self.max_procs, procs)
+
+    def _loop(self):
+        while True:
+            try: self.sample()
+            except Exception: pass
+            if self.stopped.wait(RESOURCE_SAMPLE_S): break
+
+    def stop(self, account):
+        self.stopped.set()
+        self.thread.join(timeout=2)
+        # 驱动 quit 后 Chrome 子进程应随之退出，给 2 秒收尾，仍存活的就是泄漏；共享浏览器本就不随账号退出
+        _, alive = psutil.wait_procs([] if self.gh.host else list(self.chrome.values()), timeout=2)
+        if alive:
+            print(f"⚠️ 关闭后仍有 {len(alive)} 个 Chrome 子进程存活: {','.join(str(p.pid) for p in alive[:10])}")
+        cpu = {}
+        for group, sec in self.cpu.values(): cpu[group] = round(cpu.get(group, 0) + sec, 2)
+        peak = self.peak.get("total", 0)
+        print(f"🧮 资源峰值: 合计 {peak / 1024:.0f} MB (Chrome {self.peak.get('chrome', 0) / 1024:.0f} MB) | "
+              f"进程 {self.max_procs} | 线程 {self.max_threads} | CPU {sum(cpu.values()):.1f}s")
+        METRICS.record("resources", 0, account=account, peak_kb=self.peak, cpu_s=cpu, max_threads=self.max_threads,
+                       max_procs=self.max_procs, leaked=len(alive), phases=self.phases)
+
+TITLES = {
+    "renew_success": "🎉 <b>GreatHost 续期成功</b>",
+    "maxed_out": "🈵 <b>GreatHost 已达上限</b>",
+    "cooldown": "⏳ <b>GreatHost 还在冷却中</b>",
+    "renew_failed": "⚠️ <b>GreatHost 续期未生效</b>",
+    "error": "🚨 <b>GreatHost 脚本报错</b>",
+    "summary": "📊 <b>GreatHost 批量续期汇总</b>"
+}
+
+def render_notices(notices):
+    if len(notices) == 1:
+        n = notices[0]
+        return f"{n['title']}\n\n{n['body']}\n📅 时间: {n['time']}"
+    blocks = "\n\n".join(f"{n['title']}\n{n['body']}" for n in notices)
+    return f"📦 <b>GreatHost 本轮通知 ({len(notices)} 条)</b>\n\n{blocks}\n📅 时间: {notices[-1]['time']}"
+
+# ===== 通知通道: send(notices) 失败时抛异常，由 Notifier 负责重试 =====
+class TelegramSink:
+    LIMIT = 4000
+
+    def __init__(self):
+        self.s = requests.Session()
+        self.s.trust_env = False # 强制直连，不走代理
+        self.progress = ("", 0) # (消息, 已送达块数)；Notifier 会整批重试，已发出的块不能再发
+
+    def send(self, notices):
+        if not (TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID): return
+        msg = render_notices(notices)
+        # Telegram 单条上限 4096 字符，按行切块
+        chunks, cur = [], ""
+        for line in msg.split("\n"):
+            if cur and len(cur) + len(line) + 1 > self.LIMIT: chunks.append(cur); cur = ""
+            cur = f"{cur}\n{line}" if cur else line
+        chunks.append(cur)
+        done = self.progress[1] if self.progress[0] == msg else 0
+        for i, chunk in enumerate(chunks[done:], done):
+            r = self.s.post(
                 f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-                data={"chat_id": TELEGRAM_CHAT_ID, "text": msg, "parse_mode": "HTML"},
-                proxies={"http": None, "https": None}, # <-- 只需要加这一行，强制直连
-                timeout=10 # 稍微增加超时防止网络卡顿
+                data={"chat_id": TELEGRAM_CHAT_ID, "text": chunk, "parse_mode": "HTML"},
+                timeout=10
             )
+            if r.status_code == 429:
+                time.sleep(min(30, r.json().get("parameters", {}).get("retry_after", 5)))
+            if not r.ok:
+                self.progress = (msg, i)
+                raise Exception(f"Telegram {r.status_code}: 第 {i + 1}/{len(chunks)} 块 {r.text[:100]}")
+        self.progress = ("", 0)
+
+class MarkdownSink:
+    def __init__(self, path=README_FILE):
+        self.path = path
+
+    def send(self, notices):
+        md = render_notices(notices).replace("<b>", "**").replace("</b>", "**").replace("<code>", "`").replace("</code>", "`")
+        if METRICS_README and METRICS.spans: md += f"\n\n{METRICS.table()}"
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(f"# GreatHost 自动续期状态\n\n{md}\n\n> 最近更新: {now_shanghai()}")
+
+class JsonlSink:
+    def __init__(self, path=NOTIFY_JSONL):
+        self.path = path
+
+    def send(self, notices):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for n in notices: f.write(json.dumps(n, ensure_ascii=False) + "\n")
+
+SINKS = {"telegram": TelegramSink, "readme": MarkdownSink, "jsonl": JsonlSink}
+
+class Notifier:
+    # 后台线程投递，主流程只入队；摘要模式下整轮攒成一条，flush 时发出
+    def __init__(self, sinks, digest=NOTIFY_DIGEST):
+        self.sinks, self.digest = sinks, digest
+        self.q = queue.Queue()
+        self.buf, self.lock = [], threading.Lock()
+        self.t = None
+
+    def post(self, notice):
+        if self.digest:
+            with self.lock: self.buf.append(notice)
+        else:
+            self._put([notice])
+
+    def _put(self, batch):
+        if self.t is None or not self.t.is_alive():
+            self.t = threading.Thread(target=self._loop, name="notifier", daemon=True)
+            self.t.start()
+        self.q.put(batch)
+
+    def _loop(self):
+        while True:
+            batch = self.q.get()
+            for sink in self.sinks:
+                for attempt in range(NOTIFY_RETRIES + 1):
+                    try:
+                        with METRICS.span("notify", sink=type(sink).__name__, attempt=attempt):
+                            sink.send(batch)
+                        break
+                    except Exception as e:
+                        if attempt == NOTIFY_RETRIES:
+                            print(f"⚠️ 通知发送失败 [{type(sink).__name__}]: {e}")
+                        else:
+                            time.sleep(min(30, 2 ** attempt) + random.uniform(0, 1))
+            self.q.task_done()
+
+    def flush(self, timeout=60):
+        with self.lock: batch, self.buf = self.buf, []
+        if batch: self._put(batch)
+        end = time.time() + timeout
+        while self.q.unfinished_tasks and time.time() < end: time.sleep(0.05)
+
+NOTIFIER = Notifier([SINKS[k.strip()]() for k in NOTIFY_SINKS.split(",") if k.strip() in SINKS])
+atexit.register(NOTIFIER.flush)
+
+def send_notice(kind, fields):
+    body = "\n".join([f"{e} {k}: {v}" for e, k, v in fields])
+    NOTIFIER.post({"kind": kind, "title": TITLES.get(kind, "📢 通知"), "body": body, "time": now_shanghai()})
+
+def mask_email(email):
+    return f"{email[:3]}***" if email else "***"
+
+def _split_targets(t):
+    return [x.strip() for x in (t.split(",") if isinstance(t, str) else t or []) if x.strip()] or ["*"]
+
+# ===== 代理池: 启动浏览器前并发探测，按延迟挑最快的健康代理，运行中遇到连接错误换下一个 =====
+PROXY_ERRORS = ("ERR_PROXY", "ERR_TUNNEL", "ERR_SOCKS", "ERR_CONNECTION", "ERR_TIMED_OUT", "ERR_NAME_NOT_RESOLVED",
+                "ProxyError", "SOCKSHTTP", "ConnectTimeout", "Max retries exceeded", "Failed to fetch", "出口 IP 与代理不符")
+
+def is_proxy_error(e):
+    return any(k in str(e) for k in PROXY_ERRORS) or isinstance(e, requests.exceptions.ConnectionError)
+
+def parse_proxies(raw):
+    return [x.strip() for x in re.split(r"[,\n]", raw or "") if x.strip() and not x.strip().startswith("#")]
+
+def load_proxy_list():
+    if PROXY_POOL: return parse_proxies(PROXY_POOL)
+    if PROXY_POOL_FILE and os.path.exists(PROXY_POOL_FILE):
+        with open(PROXY_POOL_FILE, encoding="utf-8") as f: return parse_proxies(f.read())
+    return [PROXY_URL] if PROXY_URL else []
+
+def _proxy_key(proxy):
+    return hashlib.sha256(proxy.encode()).hexdigest()[:16] # 缓存里不落明文代理(可能带密码)
+
+class ProxyPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        try:
+            with open(PROXY_PROBE_CACHE, encoding="utf-8") as f: self.cache = json.load(f)
+        except: self.cache = {}
+
+    def probe_one(self, proxy):
+        t0 = time.perf_counter()
+        try:
+            r = requests.get(IP_URL, proxies={"http": proxy or None, "https": proxy or None}, timeout=PROXY_PROBE_TIMEOUT)
+            ip = r.json().get("ip", "")
+            res = {"ok": bool(ip), "ip": ip, "ms": round((time.perf_counter() - t0) * 1000), "err": ""}
+        except Exception as e:
+            res = {"ok": False, "ip": "", "ms": None, "err": str(e)[:120]}
+        return {**res, "ts": time.time()}
+
+    def probe(self, proxies):
+        now = time.time()
+        with self.lock:
+            stale = [p for p in proxies if now - self.cache.get(_proxy_key(p), {}).get("ts", 0) > PROXY_PROBE_TTL_S]
+        if stale:
+            with METRICS.span("proxy_probe", count=len(stale)), ThreadPoolExecutor(max_workers=min(16, len(stale))) as pool:
+                got = list(pool.map(self.probe_one, stale))
+            with self.lock:
+                for p, res in zip(stale, got): self.cache[_proxy_key(p)] = res
+                self._save()
+        with self.lock: return {p: self.cache[_proxy_key(p)] for p in proxies}
+
+    def ranked(self, proxies):
+        # 没配置代理时直连，不需要探测
+        if not proxies: return [""]
+        res = self.probe(proxies)
+        healthy = sorted((p for p in proxies if res[p]["ok"]), key=lambda p: res[p]["ms"])
+        for i, p in enumerate(proxies):
+            r = res[p]
+            print(f"🛰️ 代理#{i + 1}: {'✅ ' + str(r['ms']) + 'ms ' + mask_host(r['ip']) if r['ok'] else '❌ ' + r['err'][:60]}")
+        return healthy
+
+    def egress(self, proxy):
+        # 出口 IP 优先复用探测缓存，过期才真正请求一次
+        if not proxy: return self.probe_one("")["ip"] or "Unknown"
+        return self.probe([proxy])[proxy]["ip"] or "Unknown"
+
+    def mark_bad(self, proxy):
+        if not proxy: return
+        with self.lock:
+            self.cache[_proxy_key(proxy)] = {"ok": False, "ip": "", "ms": None, "err": "运行中连接失败", "ts": time.time()}
+            self._save()
+
+    def _save(self):
+        try:
+            with open(PROXY_PROBE_CACHE, "w", encoding="utf-8") as f: json.dump(self.cache, f)
         except: pass
 
+POOL = ProxyPool()
+EGRESS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="egress")
+
+def mask_host(h):
+    if not h: return "Unknown"
+    if ":" in h:
+        p = h.split(':')
+        return f"{p[0]}:{p[1]}:****:{p[-1]}" if len(p) > 3 else f"{h[:9]}****"
+    parts = h.split('.')
+    if len(parts) == 4: return f"{parts[0]}.{parts[1]}.***.{parts[3]}"
+    if len(parts) >= 3: return f"{parts[0]}.****.{parts[-1]}"
+    return f"{h[:4]}****"
+
+def proxy_host_ips(proxy):
+    host = urlparse(proxy if "://" in proxy else f"http://{proxy}").hostname
+    if not host: return set()
+    try: return {host.lower()} | {a[4][0].lower() for a in socket.getaddrinfo(host, None)}
+    except OSError: return {host.lower()}
+
+def check_egress(proxy, ip):
+    # 同旧版 check_proxy_ip: 出口 IP 必须是代理主机本身 (IPv6 比较前 4 段)
+    if not (PROXY_IP_CHECK and proxy) or ip in ("", "Unknown"): return
+    cur = ip.lower()
+    for exp in proxy_host_ips(proxy):
+        if exp == cur or (":" in cur and ":" in exp and cur.split(":")[:4] == exp.split(":")[:4]): return
+    exp = urlparse(proxy if "://" in proxy else f"http://{proxy}").hostname
+    raise Exception(f"出口 IP 与代理不符: 配置 {mask_host(exp)} / 实际 {mask_host(cur)}")
+
+def load_accounts():
+    # 配置格式: [{"email": "...", "password": "...", "proxy": "socks5://..." 或 [...], "targets": ["loveMC"] 或 "*"}]
+    # 账号没写 proxy 时使用全局代理池
+    raw = None
+    if ACCOUNTS_FILE and os.path.exists(ACCOUNTS_FILE):
+        with open(ACCOUNTS_FILE, encoding="utf-8") as f: raw = json.load(f)
+    elif ACCOUNTS_JSON:
+        raw = json.loads(ACCOUNTS_JSON)
+    pool = load_proxy_list()
+    if not raw:
+        return [{"email": EMAIL, "password": PASSWORD, "proxies": pool, "targets": _split_targets(TARGET_NAME)}]
+    return [{
+        "email": a["email"],
+        "password": a["password"],
+        "proxies": parse_proxies(a["proxy"]) if isinstance(a.get("proxy"), str) else a.get("proxy") or pool,
+        "targets": _split_targets(a.get("targets", TARGET_NAME))
+    } for a in raw]
+
+# ===== 登录态缓存: 按邮箱分组，用账号密码派生密钥加密 =====
+def _session_key(email):
+    return hashlib.sha256(email.lower().encode()).hexdigest()[:16]
+
+def _session_cipher(email, password):
+    raw = hashlib.scrypt(password.encode(), salt=email.lower().encode(), n=2**14, r=8, p=1, dklen=32)
+    return Fernet(base64.urlsafe_b64encode(raw))
+
+# 多账号并发登录会同时改缓存文件，读-改-替换必须整体串行
+SESSION_LOCK = threading.Lock()
+
+def _read_session_file():
     try:
-        md = msg.replace("<b>", "**").replace("</b>", "**").replace("<code>", "`").replace("</code>", "`")
-        with open("README.md", "w", encoding="utf-8") as f:
-            f.write(f"# GreatHost 自动续期状态\n\n{md}\n\n> 最近更新: {now_shanghai()}")
-    except: pass
+        with open(SESSION_CACHE, encoding="utf-8") as f: return json.load(f)
+    except: return {}
 
-class GH:
+def load_session(email, password):
+    if not (SESSION_CACHE and Fernet and email and password): return None
+    entry = _read_session_file().get(_session_key(email))
+    if not entry: return None
+    if entry.get("exp", 0) <= time.time():
+        print("🗝️ 登录态缓存已过期")
+        return None
+    try:
+        return json.loads(_session_cipher(email, password).decrypt(entry["blob"].encode()))
+    except (InvalidToken, KeyError, ValueError):
+        print("🗝️ 登录态缓存无法解密，忽略")
+        return None
+
+def save_session(email, password, cookies, ua):
+    if not (SESSION_CACHE and Fernet and email and password): return
+    try:
+        now = time.time()
+        exp = min([c["expiry"] for c in cookies if c.get("expiry")] + [now + SESSION_TTL_H * 3600])
+        blob = _session_cipher(email, password).encrypt(json.dumps({"cookies": cookies, "ua": ua}).encode()).decode()
+        with SESSION_LOCK:
+            data = _read_session_file()
+            data[_session_key(email)] = {"exp": int(exp), "saved": int(now), "blob": blob}
+            _write_session_file(data)
+        print(f"🗝️ 登录态已缓存，有效至 {datetime.fromtimestamp(exp, ZoneInfo('Asia/Shanghai')).strftime('%m/%d %H:%M')}")
+    except Exception as e:
+        print(f"⚠️ 登录态缓存写入失败: {e}")
+
+def _write_session_file(data):
+    # 临时文件名带进程/线程号，别的进程同时写也不会互相覆盖半成品
+    tmp = f"{SESSION_CACHE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, SESSION_CACHE)
+
+def drop_session(email):
+    with SESSION_LOCK:
+        data = _read_session_file()
+        if data.pop(_session_key(email), None) is None: return
+        try: _write_session_file(data)
+        except: pass
+
+# ===== 录制/回放: 把脱敏后的 API 往来存成夹具，回放时冒充 requests 会话走完整判定流程 =====
+UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.I)
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+IPV4_RE = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+SECRET_KEYS = ("token", "password", "secret", "cookie", "session", "email", "apikey")
+IP_KEYS = ("ip", "ipaddress", "ipv4", "ipv6", "address", "host")
+ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$")
+
+def shift_times(obj, delta):
+    # 到期/冷却都是绝对时间，回放时整体平移到"现在"，判定结果才和录制当时一致
+    if isinstance(obj, dict): return {k: shift_times(v, delta) for k, v in obj.items()}
+    if isinstance(obj, list): return [shift_times(v, delta) for v in obj]
+    if isinstance(obj, str) and ISO_RE.match(obj):
+        t = parse_time(obj)
+        if t: return (t + delta).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    return obj
+
+RUN_DIR_RE = re.compile(r"^\d{8}-\d{6}-\d+$")
+
+class Recorder:
+    def __init__(self, root):
+        # 每次运行单独一个子目录，重复录制到同一目录不会覆盖或混入上一次的夹具
+        self.root = os.path.join(root, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        self.ids, self.seq = {}, {}
+        self.lock = threading.Lock()
+
+    def _id(self, m):
+        # 同一真实 ID 始终映射到同一个假 UUID，路径和响应体里的引用才对得上
+        return self.ids.setdefault(m.group(0).lower(), f"00000000-0000-4000-8000-{len(self.ids) + 1:012d}")
+
+    def scrub(self, obj):
+        if isinstance(obj, dict):
+            return {k: "***" if any(x in k.lower() for x in SECRET_KEYS) else "203.0.113.1" if k.lower() in IP_KEYS and obj[k]
+                    else self.scrub(v) for k, v in obj.items()}
+        if isinstance(obj, list): return [self.scrub(v) for v in obj]
+        if isinstance(obj, str):
+            return IPV4_RE.sub("203.0.113.1", EMAIL_RE.sub("user@example.com", UUID_RE.sub(self._id, obj)))
+        return obj
+
+    def save(self, email, call):
+        with self.lock:
+            fx = {"method": call["method"], "path": self.scrub(call["path"]), "status": call["status"], "recorded_at": time.time(),
+                  "ms": round(call.get("ms", 0), 1), "data": self.scrub(call["data"])}
+            d = os.path.join(self.root, _session_key(email))
+            n = self.seq[d] = self.seq.get(d, 0) + 1
+        slug = re.sub(r"\W+", "_", path_tpl(fx["path"])).strip("_")
+        try:
+            os.makedirs(d, exist_ok=True)
+            with open(os.path.join(d, f"{n:04d}_{fx['method']}_{slug}.json"), "w", encoding="utf-8") as f:
+                json.dump(fx, f, ensure_ascii=False, indent=1)
+        except Exception as e:
+            print(f"⚠️ 录制写入失败: {e}")
+
+RECORDER = Recorder(API_RECORD_DIR) if API_RECORD_DIR else None
+
+class ReplayResponse:
+    def __init__(self, status, data):
+        self.status_code, self._data = status, data
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return self._data
+
+class Replay:
+    # 冒充 requests.Session: 同一 方法+路径 按录制顺序依次返回，用完后一直重复最后一条
+    def __init__(self, email):
+        # 指向录制根目录时取最近一次运行，也可以直接指向某次运行的子目录
+        base = API_REPLAY_DIR
+        runs = sorted(x for x in os.listdir(base) if RUN_DIR_RE.match(x))
+        if runs: base = os.path.join(base, runs[-1])
+        root = os.path.join(base, _session_key(email))
+        if not os.path.isdir(root):
+            # 单账号录制换个邮箱回放也能用
+            subs = [x for x in os.listdir(base) if os.path.isdir(os.path.join(base, x))]
+            root = os.path.join(base, subs[0]) if len(subs) == 1 else base
+        self.calls, self.lock = {}, threading.Lock()
+        for name in sorted(os.listdir(root)):
+            if not name.endswith(".json"): continue
+            with open(os.path.join(root, name), encoding="utf-8") as f: fx = json.load(f)
+            if fx.get("recorded_at"): fx["data"] = shift_times(fx["data"], timedelta(seconds=time.time() - fx["recorded_at"]))
+            self.calls.setdefault((fx["method"], fx["path"]), []).append(fx)
+        print(f"📼 回放 {sum(map(len, self.calls.values()))} 条录制 ({root})")
+
+    def take(self, method, path):
+        with self.lock:
+            q = self.calls.get((method, path))
+            if not q: return {"status": 404, "data": {"success": False, "message": f"回放缺少录制: {method} {path}"}}
+            return q.pop(0) if len(q) > 1 else q[0]
+
+    def request(self, method, url, timeout=None):
+        fx = self.take(method, url[len(BASE_URL):])
+        return ReplayResponse(fx["status"], fx["data"])
+
+    def close(self):
+        pass
+
+# ===== 请求拦截: 页面加载只放行站点自身的文档/脚本/接口，其余一律丢弃 =====
+BLOCK_TYPES = [
+    ("image", re.compile(r"\.(png|jpe?g|gif|webp|avif|svg|ico|bmp)$", re.I), "image/"),
+    ("font", re.compile(r"\.(woff2?|ttf|otf|eot)$", re.I), "font/"),
+    ("style", re.compile(r"\.css$", re.I), "text/css"),
+    ("media", re.compile(r"\.(mp4|webm|mp3|ogg|m4a)$", re.I), "video/"),
+]
+# 被拦截请求拿不到真实大小，按常见体积估算节省流量
+BLOCK_EST_BYTES = {"image": 40_000, "font": 35_000, "style": 25_000, "media": 300_000, "script": 60_000, "other": 5_000}
+
+def _host_ok(host, allowed):
+    return any(host == h or host.endswith(f".{h}") for h in allowed)
+
+class Interceptor:
     def __init__(self):
+        self.allowed = [urlparse(BASE_URL).hostname, urlparse(IP_URL).hostname] + [h.strip() for h in ALLOW_HOSTS.split(",") if h.strip()]
+        self.lock = threading.Lock()
+        self.blocked, self.passed, self.bytes_est = {}, 0, 0
+
+    def kind(self, request):
+        path, accept = urlparse(request.url).path, request.headers.get("Accept", "") or ""
+        for name, ext, mime in BLOCK_TYPES:
+            if ext.search(path) or accept.startswith(mime): return name
+        return "script" if path.endswith(".js") else None
+
+    def __call__(self, request):
+        host = urlparse(request.url).hostname or ""
+        kind = self.kind(request)
+        if _host_ok(host, self.allowed) and kind in (None, "script"):
+            with self.lock: self.passed += 1
+            return
+        self.count(kind or "other")
+        request.abort()
+
+    def count(self, kind):
+        with self.lock:
+            self.blocked[kind] = self.blocked.get(kind, 0) + 1
+            self.bytes_est += BLOCK_EST_BYTES[kind]
+
+    def drain(self, d):
+        # 原生模式没有 MITM，改从性能日志里数 setBlockedURLs 拦下的加载；日志未开启(wire 模式)时直接跳过
+        try: entries = d.get_log("performance")
+        except WebDriverException: return
+        for e in entries:
+            msg = json.loads(e["message"]).get("message", {})
+            if msg.get("method") == "Network.loadingFailed" and msg["params"].get("blockedReason"):
+                self.count(NATIVE_KINDS.get(msg["params"].get("type"), "other"))
+            elif msg.get("method") == "Network.loadingFinished":
+                with self.lock: self.passed += 1
+
+    def report(self, account):
+        total = sum(self.blocked.values())
+        if not total: return
+        detail = " ".join(f"{k}={v}" for k, v in self.blocked.items())
+        print(f"🧱 已拦截 {total} 个请求 ({detail})，放行 {self.passed}，约省 {self.bytes_est / 1024:.0f} KB")
+        METRICS.record("intercept", 0, account=account, blocked=total, passed=self.passed, bytes_est=self.bytes_est, **self.blocked)
+
+# 原生模式没有 selenium-wire 拦截器，改用 CDP 黑名单挡住大头
+NATIVE_KINDS = {"Image": "image", "Font": "font", "Stylesheet": "style", "Media": "media", "Script": "script"}
+NATIVE_BLOCK_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.woff", "*.woff2",
+                     "*.ttf", "*.otf", "*.css", "*.mp4", "*.webm", "*googletagmanager.com*", "*google-analytics.com*",
+                     "*doubleclick.net*", "*facebook.net*", "*hotjar.com*", "*clarity.ms*"]
+
+def use_wire(proxy):
+    if BROWSER_MODE in ("wire", "native"): return BROWSER_MODE == "wire"
+    # Chrome 原生 --proxy-server 不支持账号密码，只有这种情况或需要抓包才走 MITM
+    return CAPTURE != "off" or bool(proxy and urlparse(proxy if "://" in proxy else f"http://{proxy}").username)
+
+def native_proxy(proxy):
+    u = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+    scheme = "socks5" if u.scheme.startswith("socks5") else u.scheme
+    return f"{scheme}://{u.hostname}:{u.port}"
+
+def native_proxy_arg(proxy):
+    return f"--proxy-server={native_proxy(proxy)}"
+
+def _apply_capture_policy(storage):
+    # selenium-wire 的拦截器只对 scopes 内的请求生效，所以不缩 scopes，改为在存储层筛选
+    api = re.compile(rf"^{re.escape(BASE_URL)}/api/")
+    save_req, save_resp = storage.save_request, storage.save_response
+    def save_request(request):
+        # 不落库的请求 id 保持 None，响应也就不会被保存
+        if CAPTURE == "memory" and api.search(request.url): save_req(request)
+    def save_response(request_id, response):
+        # 此时响应已回给浏览器，截断只影响留存副本
+        if response.body and len(response.body) > CAPTURE_MAX_BODY: response.body = response.body[:CAPTURE_MAX_BODY]
+        save_resp(request_id, response)
+    storage.save_request, storage.save_response = save_request, save_response
+
+class BrowserHost:
+    # 整轮只启动一个 Chrome，每个账号一个 CDP 浏览器上下文(Cookie/存储互相隔离)，内存按标签页而不是浏览器数增长
+    # WebDriver 会话只有一个"当前窗口"，所以账号间通过 lock 串行使用并在操作前切窗口
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.d = self.home = self.current = None
+
+    def _launch(self):
         opts = Options()
         opts.add_argument("--headless=new")
         opts.add_argument("--no-sandbox")
-        proxy = {'proxy': {'http': PROXY_URL, 'https': PROXY_URL}} if PROXY_URL else None
-        self.d = webdriver.Chrome(options=opts, seleniumwire_options=proxy)
-        self.w = WebDriverWait(self.d, 25)
+        if BLOCK_RESOURCES: opts.add_argument("--blink-settings=imagesEnabled=false")
+        self.d = webdriver.Chrome(options=opts)
+        # 默认标签页留着不用，保证关掉最后一个账号的窗口时会话不结束
+        self.home = self.current = self.d.current_window_handle
+        print("🧭 共享 Chrome 启动，各账号使用独立浏览器上下文")
+
+    def open(self, proxy):
+        with self.lock:
+            if self.d is None: self._launch()
+            params = {"proxyServer": native_proxy(proxy)} if proxy else {}
+            ctx = self.d.execute_cdp_cmd("Target.createBrowserContext", params)["browserContextId"]
+            tid = self.d.execute_cdp_cmd("Target.createTarget", {"url": "about:blank", "browserContextId": ctx})["targetId"]
+            # chromedriver 的窗口句柄就是 targetId (旧版带 CDwindow- 前缀)
+            handle = next(h for h in self.d.window_handles if h.endswith(tid))
+            self.switch(handle)
+            if BLOCK_RESOURCES:
+                self.d.execute_cdp_cmd("Network.enable", {})
+                self.d.execute_cdp_cmd("Network.setBlockedURLs", {"urls": NATIVE_BLOCK_URLS})
+            return self.d, ctx, handle
+
+    def switch(self, handle):
+        if self.current != handle:
+            self.d.switch_to.window(handle)
+            self.current = handle
+
+    def close(self, ctx, handle):
+        with self.lock:
+            if self.d is None: return
+            try:
+                self.switch(handle)
+                self.d.close()
+            except WebDriverException:
+                pass
+            self.d.switch_to.window(self.home)
+            self.current = self.home
+            try: self.d.execute_cdp_cmd("Target.disposeBrowserContext", {"browserContextId": ctx})
+            except WebDriverException: pass
+
+    def shutdown(self):
+        with self.lock:
+            if self.d:
+                try: self.d.quit()
+                except: pass
+            self.d = self.home = self.current = None
+
+HOST = BrowserHost()
+atexit.register(HOST.shutdown)
+
+class GH:
+    def __init__(self, email=EMAIL, password=PASSWORD, proxy=PROXY_URL):
+        self.email, self.password, self.proxy = email, password, proxy
+        self._d = None
+        self.s = None
+        self.deadline = time.time() + RUN_DEADLINE_S
+        # 需要 MITM 的账号(认证代理/抓包)仍然独占一个 selenium-wire 浏览器
+        self.host = HOST if SHARED_BROWSER and not use_wire(proxy) else None
+        # 共享浏览器的性能日志分不清账号，拦截计数只在独占浏览器时统计
+        self.interceptor = Interceptor() if BLOCK_RESOURCES and not self.host else None
+        self.ctx = self.handle = None
+        self.posted = set()
+        self.sampler = ResourceSampler(self) if psutil and RESOURCE_SAMPLE_S > 0 else None
+        # 出口 IP 查询和 Chrome 启动/登录并行，真正要用时再 join
+        self._ip = EGRESS.submit(lambda: "203.0.113.1") if API_REPLAY_DIR else EGRESS.submit(POOL.egress, proxy)
+
+    # Chrome 延迟到第一次真正需要时才启动，缓存命中 + http 模式可全程不开浏览器
+    @property
+    def d(self):
+        if self._d is None:
+            with METRICS.span("chrome_start", account=mask_email(self.email)) as sp:
+                if self.host:
+                    sp["shared"] = True
+                    self._d, self.ctx, self.handle = self.host.open(self.proxy)
+                else:
+                    opts = Options()
+                    opts.add_argument("--headless=new")
+                    opts.add_argument("--no-sandbox")
+                    if self.interceptor: opts.add_argument("--blink-settings=imagesEnabled=false")
+                    sp["wire"] = use_wire(self.proxy)
+                    self._d = self._launch_wire(opts) if sp["wire"] else self._launch_native(opts)
+            # http 模式登录后浏览器已释放，按钮兜底重新拉起时把会话 Cookie 带回去
+            if self.s and self.s.cookies:
+                self._load_cookies([{"name": c.name, "value": c.value, "path": c.path, "secure": bool(c.secure)} for c in self.s.cookies])
+        return self._d
+
+    def _load_cookies(self, cookies):
+        # add_cookie 需要先停在同源页面；不能用 favicon.ico，原生模式的 CDP 黑名单会把它变成拦截错误页
+        self.d.get(f"{BASE_URL}/login")
+        keep = ("name", "value", "path", "secure", "httpOnly", "expiry", "sameSite")
+        for c in cookies:
+            try: self.d.add_cookie({k: v for k, v in c.items() if k in keep})
+            except: pass
+
+    def release_browser(self):
+        # 登录态已搬进 requests 会话后 Chrome 只占内存，提前关掉
+        if self._d and self.host: self.host.close(self.ctx, self.handle)
+        elif self._d:
+            if self.interceptor: self.interceptor.drain(self._d)
+            self._d.quit()
+        self._d = self.ctx = self.handle = None
+
+    def _launch_native(self, opts):
+        if self.proxy: opts.add_argument(native_proxy_arg(self.proxy))
+        if self.interceptor: opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        d = webdriver.Chrome(options=opts)
+        if self.interceptor:
+            d.execute_cdp_cmd("Network.enable", {})
+            d.execute_cdp_cmd("Network.setBlockedURLs", {"urls": NATIVE_BLOCK_URLS})
+        print(f"🧭 原生 Chrome 启动{'(代理)' if self.proxy else ''}，不经过 selenium-wire")
+        return d
+
+    def _launch_wire(self, opts):
+        from seleniumwire import webdriver as wire # 只有需要 MITM 时才加载
+        sw = {'request_storage': 'memory', 'request_storage_max_size': CAPTURE_MAX}
+        if self.proxy: sw['proxy'] = {'http': self.proxy, 'https': self.proxy}
+        if not self.interceptor and CAPTURE == "off": sw['disable_capture'] = True
+        d = wire.Chrome(options=opts, seleniumwire_options=sw)
+        _apply_capture_policy(d.backend.storage)
+        if self.interceptor: d.request_interceptor = self.interceptor
+        return d
+
+    @contextmanager
+    def tab(self):
+        # 共享浏览器下操作期间独占 WebDriver 会话并切到本账号的窗口；独占浏览器时什么都不做
+        if not self.host:
+            yield
+            return
+        with self.host.lock:
+            if self.handle: self.host.switch(self.handle)
+            yield
+
+    def wait_for(self, cond, name, timeout=WAIT_TIMEOUT):
+        # cond 见 WAIT_JS，结果为真值即完成；整页跳转会打断脚本，换到新文档上接着等
+        end = time.time() + timeout
+        with METRICS.span("wait", account=mask_email(self.email), what=name) as sp:
+            sp["navigations"] = 0
+            while True:
+                left = end - time.time()
+                if left <= 0: break
+                self.d.set_script_timeout(left + 5)
+                try:
+                    r = self.d.execute_async_script(WAIT_JS, cond, int(left * 1000))
+                except WebDriverException as e:
+                    if not re.search(r"unload|navigat|context", str(e), re.I): raise
+                    sp["navigations"] += 1
+                    continue
+                if r and r.get("ok"):
+                    sp["js_ms"] = round(r["ms"], 1)
+                    return r["value"]
+                break
+        raise TimeoutException(f"等待超时 {timeout:.0f}s: {name}")
+
+    def attach_session(self, cookies=None, ua=None):
+        # 把浏览器登录态搬进 requests 会话，之后的 API 不再经过 Chrome
+        s = requests.Session()
+        s.trust_env = False
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        s.mount("https://", adapter); s.mount("http://", adapter)
+        if self.proxy: s.proxies = {"http": self.proxy, "https": self.proxy}
+        s.headers.update({
+            "User-Agent": ua or self.d.execute_script("return navigator.userAgent"),
+            "Accept": "application/json",
+            "Referer": f"{BASE_URL}/dashboard"
+        })
+        for c in (self.d.get_cookies() if cookies is None else cookies):
+            s.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+        self.s = s
+        print(f"🔗 已切换 HTTP 会话模式 (Cookie x{len(s.cookies)})")
+
+    def restore_session(self):
+        cached = load_session(self.email, self.password)
+        if not cached: return False
+        if API_MODE == "http":
+            self.attach_session(cached["cookies"], cached.get("ua"))
+        else:
+            self._load_cookies(cached["cookies"])
+        # 一次轻量的鉴权探测，失败才走完整登录
+        if isinstance(self.api("/api/servers").get("servers"), list):
+            print("🗝️ 登录态缓存有效，跳过登录页")
+            return True
+        print("🗝️ 登录态缓存已失效，重新登录")
+        drop_session(self.email)
+        if self.s: self.s.close(); self.s = None
+        if self._d: self._d.delete_all_cookies()
+        return False
+
+    def _fetch(self, url, method="GET"):
+        t0, status, size = time.perf_counter(), 0, 0
+        try:
+            r = self.s.request(method, f"{BASE_URL}{url}", timeout=20)
+            status, size = r.status_code, len(r.content)
+            data = r.json()
+        except Exception as e:
+            data = {"success": False, "message": str(e)}
+        return {"path": url, "method": method, "data": data, "status": status, "bytes": size, "ms": (time.perf_counter() - t0) * 1000}
+
+    def _track(self, call):
+        METRICS.record("api", call["ms"], account=mask_email(self.email), method=call["method"],
+                       path=path_tpl(call["path"]), status=call["status"], bytes=call["bytes"])
+        self.last_status = call["status"]
+        if RECORDER: RECORDER.save(self.email, call)
+        return call["data"]
+
+    def retry(self, step, fn, *args):
+        # 复用同一个浏览器/会话重试，不重新启动 Chrome
+        attempts, base = RETRY_POLICY.get(step, (1, 0))
+        for n in range(1, attempts + 1):
+            if time.time() >= self.deadline: raise Exception(f"超出整轮时限 {RUN_DEADLINE_S:.0f}s ({step})")
+            try:
+                return fn(*args)
+            except Exception as e:
+                left = self.deadline - time.time()
+                if n == attempts or not retryable(e) or left <= 0: raise
+                delay = min(left, base * 2 ** (n - 1) * random.uniform(0.5, 1.5))
+                print(f"🔁 {step} 第 {n} 次失败，{delay:.1f}s 后重试: {str(e)[:80]}")
+                METRICS.record("retry", delay * 1000, account=mask_email(self.email), step=step, error=type(e).__name__)
+                time.sleep(delay)
 
     def api(self, url, method="GET"):
         print(f"📡 API 调用 [{method}] {url}")
-        script = f"return fetch('{url}',{{method:'{method}'}}).then(r=>r.json()).catch(e=>({{success:false,message:e.toString()}}))"
-        return self.d.execute_script(script)
+        if self.s: return self._track(self._fetch(url, method))
+        with self.tab():
+            self.d.set_script_timeout(30)
+            call = self.d.execute_async_script(API_JS, url, method)
+        return self._track(call)
 
     def get_ip(self):
-        try:
-            self.d.get("https://api.ipify.org?format=json")
-            ip = json.loads(self.d.find_element(By.TAG_NAME, "body").text).get("ip", "Unknown")
-            print(f"🌐 落地 IP: {ip}")
-            return ip
-        except:
-            print("🌐 落地 IP: 无法获取")
-            return "Unknown"
+        with METRICS.span("get_ip", account=mask_email(self.email)):
+            try:
+                ip = self._ip.result(timeout=PROXY_PROBE_TIMEOUT + 5)
+            except Exception:
+                ip = "Unknown"
+        check_egress(self.proxy, ip)
+        return ip
 
     def login(self):
-        print(f"🔑 正在登录: {EMAIL[:3]}***...")
-        self.d.get("https://greathost.es/login")
-        self.w.until(EC.presence_of_element_located((By.NAME, "email"))).send_keys(EMAIL)
-        self.d.find_element(By.NAME, "password").send_keys(PASSWORD)
-        self.d.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
-        self.w.until(EC.url_contains("/dashboard"))
+        with METRICS.span("login", account=mask_email(self.email)) as sp:
+            if API_REPLAY_DIR:
+                self.s, sp["cached"] = Replay(self.email), True
+                return
+            with self.tab():
+                sp["cached"] = self.restore_session()
+                if not sp["cached"]: self._login_form()
 
-    def get_server(self):
-        servers = self.api("/api/servers").get("servers", [])
-        return next((s for s in servers if s.get("name") == TARGET_NAME), None)
+    def _login_form(self):
+        print(f"🔑 正在登录: {mask_email(self.email)}...")
+        self.d.get(f"{BASE_URL}/login")
+        self.wait_for({"selector": "[name=email]"}, "login_form").send_keys(self.email)
+        self.d.find_element(By.NAME, "password").send_keys(self.password)
+        self.d.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+        self.wait_for({"path": "/dashboard"}, "dashboard")
+        cookies, ua = self.d.get_cookies(), self.d.execute_script("return navigator.userAgent")
+        save_session(self.email, self.password, cookies, ua)
+        if API_MODE == "http": self.attach_session(cookies, ua)
 
-    def get_status(self, sid):
-        info = self.api(f"/api/servers/{sid}/information")
-        st = info.get("status", "unknown").lower()
-        icon, name = STATUS_MAP.get(st, ["❓", st])
-        print(f"📋 状态核对: {TARGET_NAME} | {icon} {name}")
-        return icon, name
+    def snapshot(self, targets):
+        # 服务器列表 + 每台的 information/contract 并发抓取，整体只占一次 WebDriver 往返
+        print(f"📡 API 批量读取 [{','.join(targets)}]")
+        with METRICS.span("snapshot", account=mask_email(self.email)):
+            if self.s:
+                snap = self._snapshot_http(targets)
+            else:
+                with self.tab():
+                    self.d.set_script_timeout(40)
+                    snap = self.d.execute_async_script(SNAPSHOT_JS, targets)
+        for call in snap["calls"]: self._track(call)
+        failed = [c for c in snap["calls"] if bad_status(c)]
+        if failed or not snap["calls"]:
+            c = failed[0] if failed else {"path": "/api/servers", "status": 0, "data": snap["servers"]}
+            raise RetryableError(f"批量读取失败 {c['path']} [{c['status']}]: {c['data'].get('message', '')}")
+        first = snap["calls"][0]["ms"]
+        print(f"⏱️ 批量读取完成: {len(snap['items'])} 台 | 列表 {first:.0f}ms | 总计 {snap['total']:.0f}ms")
+        return snap
 
-    def get_renew_info(self, sid):
-        data = self.api(f"/api/renewal/contracts/{sid}")
-        print(f"DEBUG: 原始合同数据 -> {str(data)[:100]}...")
-        return data.get("contract", {}).get("renewalInfo") or data.get("renewalInfo", {})
+    def _snapshot_http(self, targets):
+        t0 = time.perf_counter()
+        first = self._fetch("/api/servers")
+        listing = first["data"]
+        servers = [x for x in listing.get("servers") or [] if "*" in targets or x.get("name") in targets]
+        paths = [p for x in servers for p in (f"/api/servers/{x['id']}/information", f"/api/renewal/contracts/{x['id']}")]
+        with ThreadPoolExecutor(max_workers=min(8, len(paths) or 1)) as pool:
+            got = list(pool.map(self._fetch, paths))
+        items = [{"server": x, "information": got[2*i]["data"], "contract": got[2*i+1]["data"]} for i, x in enumerate(servers)]
+        return {"servers": listing, "items": items, "calls": [first, *got], "total": (time.perf_counter() - t0) * 1000}
 
     def get_btn(self, sid):
-        self.d.get(f"https://greathost.es/contracts/{sid}")
-        btn = self.w.until(EC.presence_of_element_located((By.ID, "renew-free-server-btn")))
-        self.w.until(lambda d: btn.text.strip() != "")
-        
-        btn_text = btn.text.strip()
-        print(f"🔘 按钮状态: '{btn_text}'")
-        return btn_text
-
-    def renew(self, sid):
+        with METRICS.span("get_btn", account=mask_email(self.email)):
+            if API_REPLAY_DIR:
+                fx = self.s.take("PAGE", f"/contracts/{sid}")
+                # 缺按钮录制时不能当成"没有 Wait"去续期
+                if fx["status"] != 200 or "button" not in fx["data"]: raise Exception(f"回放缺少按钮录制: /contracts/{sid}")
+                btn_text = fx["data"]["button"]
+            else:
+                with self.tab():
+                    self.d.get(f"{BASE_URL}/contracts/{sid}")
+                    btn_text = self.wait_for({"selector": "#renew-free-server-btn", "text": True}, "renew_btn")
+                # 按钮文字不走 API，用伪方法 PAGE 一并录下
+                if RECORDER: RECORDER.save(self.email, {"method": "PAGE", "path": f"/contracts/{sid}", "status": 200, "data": {"button": btn_text}})
+            print(f"🔘 按钮状态: '{btn_text}'")
+            return btn_text
+
+    def renew(self, sid, expiry=None):
+        if sid in self.posted and expiry:
+            # 上一次 POST 可能已经生效只是响应丢了，重发会被冷却拒绝并误报未生效，先核对合同
+            cur = parse_renewal(self.api(f"/api/renewal/contracts/{sid}")).get("nextRenewalDate")
+            if bad_status({"status": self.last_status}): raise RetryableError(f"续期前核对合同失败 [{self.last_status}]")
+            old, new = parse_time(expiry), parse_time(cur)
+            if old and new and new > old:
+                print("🔎 上一次续期 POST 实际已生效，不再重发")
+                return {"success": True, "message": "续期已生效 (重试前核对合同)", "details": {"nextRenewalDate": cur}}
+        self.posted.add(sid)
         print(f"🚀 正在执行续期 POST...")
-        return self.api(f"/api/renewal/contracts/{sid}/renew-free", "POST")
+        res = self.api(f"/api/renewal/contracts/{sid}/renew-free", "POST")
+        # 只有网络层失败/5xx 才重试；业务拒绝(冷却、上限)原样返回
+        if self.last_status in (0, 429) or self.last_status >= 500:
+            raise RetryableError(f"续期请求失败 [{self.last_status}]: {res.get('message', '')}")
+        return res
 
     def close(self):
-        self.d.quit()
+        if self.s: self.s.close()
+        self.release_browser()
+        if self.interceptor: self.interceptor.report(mask_email(self.email))
+        if self.sampler: self.sampler.stop(mask_email(self.email))
 
-def run():
-    gh = GH()
-    try:
-        ip = gh.get_ip()
-        gh.login()
-        srv = gh.get_server()
-        if not srv: raise Exception(f"未找到服务器 {TARGET_NAME}")
-        sid = srv["id"]
-        print(f"✅ 已锁定目标服务器: {TARGET_NAME} (ID: {sid})")
-
-        icon, stname = gh.get_status(sid)
-        status_disp = f"{icon} {stname}"
-
-        info = gh.get_renew_info(sid)
-        before = calculate_hours(info.get("nextRenewalDate"))
-
-        btn = gh.get_btn(sid)
-        print(f"🔘 按钮状态: '{btn}' | 剩余: {before}h")
-
-        if "Wait" in btn:
-            m = re.search(r"Wait\s+(\d+\s+\w+)", btn)
-            send_notice("cooldown", [
-                ("📛","服务器名称",TARGET_NAME),
-                ("🆔","ID",f"<code>{sid}</code>"),
-                ("⏳","冷却时间",m.group(1) if m else btn),
-                ("📊","当前累计",f"{before}h"),
-                ("🚀","服务器状态",status_disp)
-            ])
-            return
+def renew_server(gh, item):
+    srv = item["server"]
+    sid, name = srv["id"], srv.get("name", TARGET_NAME)
+    print(f"✅ 已锁定目标服务器: {name} (ID: {sid})")
+    result = {"account": mask_email(gh.email), "acct": _session_key(gh.email), "name": name, "sid": sid}
 
-        res = gh.renew(sid)
-        ok = res.get("success", False)
-        msg = res.get("message", "无返回消息")
-        after = calculate_hours(res.get("details", {}).get("nextRenewalDate")) if ok else before
-        print(f"📡 续期响应结果: {ok} | Date='{res.get('details',{}).get('nextRenewalDate')}' | Message='{msg}'")
-
-        if ok and after > before:
-            send_notice("renew_success", [
-                ("📛","服务器名称",TARGET_NAME),
-                ("🆔","ID",f"<code>{sid}</code>"),
-                ("⏰","增加时间",f"{before} ➔ {after}h"),
-                ("🚀","服务器状态",status_disp),
-                ("💡","提示",msg),
-                ("🌐","落地 IP",f"<code>{ip}</code>")
-            ])
-        elif "5 d" in msg or before > 108:
-            send_notice("maxed_out", [
-                ("📛","服务器名称",TARGET_NAME),
-                ("🆔","ID",f"<code>{sid}</code>"),
-                ("⏰","剩余时间",f"{after}h"),
-                ("🚀","服务器状态",status_disp),
-                ("💡","提示",msg),
-                ("🌐","落地 IP",f"<code>{ip}</code>")
-            ])
-        else:
-            send_notice("renew_failed", [
-                ("📛","服务器名称",TARGET_NAME),
-                ("🆔","ID",f"<code>{sid}</code>"),
-                ("🚀","服务器状态",status_disp),
-                ("⏰","剩余时间",f"{before}h"),
-                ("💡","提示",msg),
-                ("🌐","落地 IP",f"<code>{ip}</code>")
-            ])
-    except Exception as e:
-        print(f"🚨 运行异常: {e}")
-        # 因为 send_notice 内部已经强制直连，所以这里直接调就行，代码清爽多了
-        send_notice("error", [
-            ("📛", "服务器名称", TARGET_NAME),
-            ("❌", "故障", f"<code>{str(e)[:100]}</code>"),
-            ("🌐", "代理状态", "已尝试直连") 
+    icon, stname = parse_status(item["information"])
+    status_disp = f"{icon} {stname}"
+    print(f"📋 状态核对: {name} | {status_disp}")
+
+    print(f"DEBUG: 原始合同数据 -> {str(item['contract'])[:100]}...")
+    info = parse_renewal(item["contract"])
+    before = calculate_hours(info.get("nextRenewalDate"))
+    result.update(status=stname, expiry=info.get("nextRenewalDate"))
+
+    ready, until = resolve_cooldown(info)
+    src, btn = "API", ""
+    if ready is None:
+        # 合同里没有冷却字段时才去加载合同页读按钮
+        btn = gh.retry("get_btn", gh.get_btn, sid)
+        ready, until, src = "Wait" not in btn, parse_wait(btn), "按钮"
+    print(f"🔘 续期判定({src}): {'可续期' if ready else '冷却中'} | 剩余: {before}h")
+    result["cooldown_until"] = until.isoformat() if until and not ready else None
+
+    if not ready:
+        wait = fmt_wait(until) if until else btn or "未知"
+        send_notice("cooldown", [
+            ("📛","服务器名称",name),
+            ("🆔","ID",f"<code>{sid}</code>"),
+            ("⏳","冷却时间",wait),
+            ("📊","当前累计",f"{before}h"),
+            ("🚀","服务器状态",status_disp)
         ])
+        return {**result, "kind": "cooldown", "before": before, "after": before, "message": btn or f"冷却至 {until.isoformat()}"}
 
+    # 续期 POST 之前才 join 出口 IP，顺带拦下代理偏离
+    ip = result["ip"] = gh.get_ip()
+    print(f"🌐 落地 IP: {ip if ip != 'Unknown' else '无法获取'}")
+    res = gh.retry("renew", gh.renew, sid, info.get("nextRenewalDate"))
+    ok = res.get("success", False)
+    msg = res.get("message", "无返回消息")
+    after = calculate_hours(res.get("details", {}).get("nextRenewalDate")) if ok else before
+    if ok: result["expiry"] = res.get("details", {}).get("nextRenewalDate") or result["expiry"]
+    print(f"📡 续期响应结果: {ok} | Date='{res.get('details',{}).get('nextRenewalDate')}' | Message='{msg}'")
+
+    if ok and after > before:
+        kind = "renew_success"
+        send_notice(kind, [
+            ("📛","服务器名称",name),
+            ("🆔","ID",f"<code>{sid}</code>"),
+            ("⏰","增加时间",f"{before} ➔ {after}h"),
+            ("🚀","服务器状态",status_disp),
+            ("💡","提示",msg),
+            ("🌐","落地 IP",f"<code>{ip}</code>")
+        ])
+    elif "5 d" in msg or before > MAXED_HOURS:
+        kind = "maxed_out"
+        send_notice(kind, [
+            ("📛","服务器名称",name),
+            ("🆔","ID",f"<code>{sid}</code>"),
+            ("⏰","剩余时间",f"{after}h"),
+            ("🚀","服务器状态",status_disp),
+            ("💡","提示",msg),
+            ("🌐","落地 IP",f"<code>{ip}</code>")
+        ])
+    else:
+        kind = "renew_failed"
+        send_notice(kind, [
+            ("📛","服务器名称",name),
+            ("🆔","ID",f"<code>{sid}</code>"),
+            ("🚀","服务器状态",status_disp),
+            ("⏰","剩余时间",f"{before}h"),
+            ("💡","提示",msg),
+            ("🌐","落地 IP",f"<code>{ip}</code>")
+        ])
+    return {**result, "kind": kind, "before": before, "after": after, "message": msg}
+
+def error_result(acc, name, e):
+    print(f"🚨 运行异常: {e}")
+    # 因为 send_notice 内部已经强制直连，所以这里直接调就行，代码清爽多了
+    send_notice("error", [
+        ("📛", "服务器名称", name),
+        ("👤", "账号", mask_email(acc["email"])),
+        ("❌", "故障", f"<code>{str(e)[:100]}</code>"),
+        ("🌐", "代理状态", "已尝试直连")
+    ])
+    return {"account": mask_email(acc["email"]), "acct": _session_key(acc["email"]), "name": name, "kind": "error", "message": str(e)}
+
+def _run_with_proxy(acc, proxy, results, done, deadline):
+    gh = None
+    try:
+        gh = GH(acc["email"], acc["password"], proxy)
+        gh.deadline = deadline
+        gh.retry("login", gh.login)
+        snap = gh.retry("snapshot", gh.snapshot, acc["targets"])
+        if not isinstance(snap["servers"].get("servers"), list):
+            raise Exception(f"服务器列表获取失败: {snap['servers'].get('message', '未知错误')}")
+        if not snap["items"]: raise Exception(f"未找到服务器 {','.join(acc['targets'])}")
+        # http 模式下合同就能判定冷却时不会再读按钮，Chrome 提前释放；否则留到读完按钮，避免关了又重启
+        if gh.s and all(resolve_cooldown(parse_renewal(it["contract"]))[0] is not None for it in snap["items"]):
+            gh.release_browser()
+        # 同一账号的所有服务器复用一次登录，单台失败不影响其余；代理故障则整体上抛去换代理
+        for item in snap["items"]:
+            sid = item["server"]["id"]
+            if sid in done: continue
+            try: results.append(renew_server(gh, item))
+            except Exception as e:
+                if is_proxy_error(e): raise
+                results.append(error_result(acc, item["server"].get("name", "?"), e))
+            done.add(sid)
     finally:
         # 增加一个判断，防止 gh 没初始化成功导致报错
-        if 'gh' in locals():
+        if gh:
             try: gh.close()
             except: pass
 
+def run_account(acc):
+    results, done = [], set()
+    deadline = time.time() + RUN_DEADLINE_S
+    try:
+        proxies = [""] if API_REPLAY_DIR else POOL.ranked(acc["proxies"])
+        if not proxies: raise Exception(f"代理池 {len(acc['proxies'])} 个代理全部不可用")
+        for n, proxy in enumerate(proxies):
+            try:
+                _run_with_proxy(acc, proxy, results, done, deadline)
+                break
+            except Exception as e:
+                if not (is_proxy_error(e) and n + 1 < len(proxies)): raise
+                print(f"🔁 代理#{n + 1} 连接失败，切换下一个: {str(e)[:80]}")
+                POOL.mark_bad(proxy)
+    except Exception as e:
+        results.append(error_result(acc, ",".join(acc["targets"]), e))
+    return results
+
+# ===== 启动前短路: 按上次记下的到期/冷却时间判断这次是否可能续期，不可能就不开浏览器 =====
+def load_state():
+    try:
+        with open(STATE_FILE, encoding="utf-8") as f: return json.load(f)
+    except: return {}
+
+def save_state(results):
+    if not (STATE_FILE and results): return
+    state, now = load_state(), int(time.time())
+    for key in {r["acct"] for r in results if r.get("acct")}:
+        rs = [r for r in results if r.get("acct") == key]
+        entry = state.setdefault(key, {"servers": {}})
+        # 有报错的账号下次必须真跑，不允许被短路
+        entry["dirty"] = any(r["kind"] == "error" for r in rs)
+        entry["checked"] = now
+        for r in rs:
+            if r.get("sid"):
+                entry["servers"][r["sid"]] = {k: r.get(k) for k in ("name", "kind", "status", "before", "after", "expiry", "cooldown_until", "ip")}
+                entry["servers"][r["sid"]]["checked"] = now
+    try:
+        with open(f"{STATE_FILE}.tmp", "w", encoding="utf-8") as f: json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(f"{STATE_FILE}.tmp", STATE_FILE)
+    except Exception as e:
+        print(f"⚠️ 状态文件写入失败: {e}")
+
+def skip_until(acc, state):
+    # 返回下一次有意义的时间点；返回 None 表示这次必须真跑
+    entry = state.get(_session_key(acc["email"]))
+    if FORCE_RUN or not entry or entry.get("dirty") or not entry.get("servers"): return None
+    if FORCE_REFRESH_H and time.time() - entry.get("checked", 0) > FORCE_REFRESH_H * 3600: return None
+    servers = [x for x in entry["servers"].values() if "*" in acc["targets"] or x.get("name") in acc["targets"]]
+    if "*" not in acc["targets"] and {x.get("name") for x in servers} != set(acc["targets"]): return None
+    whens = [useful_at(x) for x in servers]
+    if not whens or None in whens: return None
+    earliest = min(whens)
+    return earliest if earliest > datetime.now(timezone.utc) else None
+
+def run():
+    accounts = load_accounts()
+    if STATE_FILE and not API_REPLAY_DIR:
+        state, todo = load_state(), []
+        for acc in accounts:
+            until = skip_until(acc, state)
+            if until:
+                print(f"⏭️ {mask_email(acc['email'])}: 最早 {until.astimezone(ZoneInfo('Asia/Shanghai')).strftime('%m/%d %H:%M')} 才可能续期，本轮跳过")
+            else:
+                todo.append(acc)
+        if not todo:
+            print("⏭️ 所有账号都无需续期，不启动浏览器")
+            # cron 下这是常态，状态文件照样刷新，看板才不会停在上一次真跑的时刻
+            STATUS.seed()
+            STATUS.export()
+            return []
+        accounts = todo
+    workers = max(1, min(MAX_WORKERS, len(accounts)))
+    print(f"👥 共 {len(accounts)} 个账号，并发 {workers}")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = [r for rs in pool.map(run_account, accounts) for r in rs]
+    HOST.shutdown()
+
+    counts = {}
+    for r in results: counts[r["kind"]] = counts.get(r["kind"], 0) + 1
+    print("📊 汇总: " + " | ".join(f"{k}={v}" for k, v in counts.items()))
+    if len(results) > 1:
+        labels = {"renew_success": ("🎉","续期成功"), "maxed_out": ("🈵","已达上限"), "cooldown": ("⏳","冷却中"),
+                  "renew_failed": ("⚠️","未生效"), "error": ("🚨","报错")}
+        fields = [(*labels.get(k, ("📢", k)), v) for k, v in counts.items()]
+        fields += [("📛", f"{r['account']}/{r['name']}", labels.get(r["kind"], ("", r["kind"]))[1]) for r in results]
+        send_notice("summary", fields)
+    finish_run(results)
+    return results
+
+def finish_run(results):
+    METRICS.export(results)
+    # 回放结果不是真实状态，不更新状态接口、不写历史也不参与下次短路
+    if not API_REPLAY_DIR:
+        # 单次运行只处理了部分账号，先从状态文件补齐其余服务器
+        STATUS.seed()
+        STATUS.update(results, METRICS.prometheus(results))
+        STATUS.export()
+        record_history(results)
+        save_state(results)
+    NOTIFIER.flush()
+
+# ===== 状态接口: 每台服务器最后已知状态常驻内存，/status 给 JSON，/metrics 给 Prometheus，不必再翻 README =====
+def _prom_label(v):
+    return str(v if v is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+class StatusCache:
+    FIELDS = ("name", "status", "kind", "before", "after", "expiry", "cooldown_until")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers, self.updated, self.run_prom, self.mtime = {}, 0, "", 0
+
+    def seed(self):
+        # 状态文件变了才重读；serve 模式下续期由别的进程在跑，靠这个跟上
+        try: mtime = os.path.getmtime(STATE_FILE)
+        except OSError: return
+        if mtime == self.mtime: return
+        state = load_state()
+        with self.lock:
+            self.mtime = mtime
+            for acct, entry in state.items():
+                for sid, x in (entry.get("servers") or {}).items():
+                    cur = self.servers.setdefault(sid, {"acct": acct, "sid": sid})
+                    if x.get("checked", 0) >= cur.get("checked", 0):
+                        cur.update({k: x.get(k) for k in self.FIELDS}, checked=x.get("checked", 0))
+            self.updated = max(self.updated, int(mtime))
+
+    def update(self, results, prom=""):
+        now = int(time.time())
+        with self.lock:
+            for r in results:
+                if r.get("sid"):
+                    cur = self.servers.setdefault(r["sid"], {"acct": r.get("acct"), "sid": r["sid"]})
+                    cur.update({k: r.get(k) for k in self.FIELDS}, account=r.get("account"), message=r.get("message"), checked=now)
+                else:
+                    # 账号级报错(登录/代理)拿不到服务器 ID，记到该账号已知的服务器上；一台都不知道就按目标名占位
+                    known = [cur for cur in self.servers.values() if cur.get("acct") == r.get("acct")]
+                    if not known:
+                        known = [self.servers.setdefault(f"{r.get('acct')}/{r.get('name')}", {"acct": r.get("acct"), "sid": None, "name": r.get("name")})]
+                    for cur in known: cur.update(kind=r["kind"], account=r.get("account"), message=r.get("message"), checked=now)
+            self.updated, self.run_prom = now, prom or self.run_prom
+
+    def snapshot(self):
+        with self.lock: servers, updated = [dict(x) for x in self.servers.values()], self.updated
+        # 账号级报错的占位条目，等该账号有了真实服务器就不再展示
+        real = {x.get("acct") for x in servers if x.get("sid")}
+        servers = [x for x in servers if x.get("sid") or x.get("acct") not in real]
+        icons = {label: icon for icon, label in STATUS_MAP.values()}
+        for x in servers:
+            x["icon"] = icons.get(x.get("status"), "❓")
+            x["hours_left"] = calculate_hours(x.get("expiry")) if x.get("expiry") else None
+        servers.sort(key=lambda x: (x.get("acct") or "", x.get("name") or ""))
+        return {"updated": updated, "servers": servers}
+
+    def prometheus(self):
+        snap = self.snapshot()
+        rows = []
+        for x in snap["servers"]:
+            until = parse_time(x.get("cooldown_until"))
+            rows.append((",".join(f'{k}="{_prom_label(x.get(k))}"' for k in ("acct", "name", "sid")), x, until))
+        # 按指标族逐块输出，TYPE 行后紧跟该族全部样本
+        lines = ["# TYPE greathost_server_hours_left gauge", *[f"greathost_server_hours_left{{{l}}} {x['hours_left'] or 0}" for l, x, _ in rows],
+                 "# TYPE greathost_server_up gauge",
+                 *[f'greathost_server_up{{{l},status="{_prom_label(x.get("status"))}"}} {int(x.get("status") == "Running")}' for l, x, _ in rows],
+                 "# TYPE greathost_server_cooldown_until_seconds gauge",
+                 *[f"greathost_server_cooldown_until_seconds{{{l}}} {int(u.timestamp()) if u else 0}" for l, x, u in rows],
+                 "# TYPE greathost_server_last_result gauge",
+                 *[f'greathost_server_last_result{{{l},kind="{_prom_label(x.get("kind"))}"}} 1' for l, x, _ in rows],
+                 "# TYPE greathost_server_last_checked_seconds gauge",
+                 *[f"greathost_server_last_checked_seconds{{{l}}} {x.get('checked') or 0}" for l, x, _ in rows]]
+        lines += ["# TYPE greathost_status_updated_seconds gauge", f"greathost_status_updated_seconds {snap['updated']}"]
+        with self.lock: run_prom = self.run_prom
+        return "\n".join(lines) + "\n" + run_prom
+
+    def export(self):
+        if not STATUS_DIR: return
+        try:
+            os.makedirs(STATUS_DIR, exist_ok=True)
+            for name, body in (("status.json", json.dumps(self.snapshot(), ensure_ascii=False, indent=1)), ("status.prom", self.prometheus())):
+                path = os.path.join(STATUS_DIR, name)
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f: f.write(body)
+                os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            print(f"⚠️ 状态文件导出失败: {e}")
+
+STATUS = StatusCache()
+
+def make_status_handler(cache):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+
+        def _send(self, code, body, ctype):
+            data = body.encode()
+            self.send_response(code)
+            self.send_header("Content-Type", f"{ctype}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            cache.seed()
+            path = urlparse(self.path).path
+            if path == "/status": return self._send(200, json.dumps(cache.snapshot(), ensure_ascii=False), "application/json")
+            if path == "/metrics": return self._send(200, cache.prometheus(), "text/plain; version=0.0.4")
+            self._send(404, json.dumps({"error": "not found"}), "application/json")
+
+    return Handler
+
+def serve_status(port):
+    STATUS.seed()
+    httpd = ThreadingHTTPServer((STATUS_HOST, port), make_status_handler(STATUS))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="greathost-status", daemon=True).start()
+    print(f"📊 状态接口: http://{STATUS_HOST}:{httpd.server_address[1]}/status  /metrics")
+    return httpd
+
+# ===== 运行历史: 每轮每台服务器一条记录，供趋势查询 =====
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, ts INTEGER NOT NULL, run_id TEXT, account TEXT, server TEXT, sid TEXT,
+    kind TEXT NOT NULL, before_h INTEGER, after_h INTEGER, status TEXT, message TEXT, ip TEXT,
+    cooldown_until TEXT, expiry TEXT, acct TEXT
+);
+"""
+# 服务器名只是显示用，多账号下会重名；统计一律按 (账号, 服务器 ID) 分组
+HISTORY_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_runs_acct_sid_ts ON runs(acct, sid, ts);
+CREATE INDEX IF NOT EXISTS idx_runs_kind_ts ON runs(kind, ts);
+"""
+
+def history_db():
+    db = sqlite3.connect(HISTORY_DB)
+    db.executescript(HISTORY_SCHEMA)
+    if "acct" not in {c[1] for c in db.execute("PRAGMA table_info(runs)")}:
+        db.execute("ALTER TABLE runs ADD COLUMN acct TEXT")
+    db.executescript(HISTORY_INDEXES)
+    return db
+
+def record_history(results):
+    if not (HISTORY_DB and results): return
+    now, run_id = int(time.time()), os.getenv("GITHUB_RUN_ID") or datetime.now().strftime("%Y%m%d%H%M%S")
+    rows = [(now, run_id, r.get("account"), r.get("name"), r.get("sid"), r["kind"], r.get("before"), r.get("after"),
+             r.get("status"), str(r.get("message", ""))[:200], r.get("ip"), r.get("cooldown_until"), r.get("expiry"), r.get("acct")) for r in results]
+    try:
+        with history_db() as db:
+            db.executemany("INSERT INTO runs (ts, run_id, account, server, sid, kind, before_h, after_h, status, message, ip, "
+                           "cooldown_until, expiry, acct) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+            db.execute("DELETE FROM runs WHERE ts < ?", (now - HISTORY_KEEP_DAYS * 86400,))
+        db.close()
+    except Exception as e:
+        print(f"⚠️ 历史记录写入失败: {e}")
+
+def history_cli(argv):
+    ap = argparse.ArgumentParser(prog="greathost.py history", description="续期历史统计")
+    ap.add_argument("--days", type=int, default=30, help="统计最近多少天")
+    ap.add_argument("--account", help="只看某个账号 (邮箱、脱敏邮箱或账号哈希)")
+    ap.add_argument("--server", help="只看某个服务器名")
+    ap.add_argument("--sid", help="只看某个服务器 ID")
+    ap.add_argument("--trend", type=int, default=10, help="每台服务器显示最近多少个剩余小时采样")
+    a = ap.parse_args(argv)
+    if not (HISTORY_DB and os.path.exists(HISTORY_DB)): return print(f"📭 没有历史数据 ({HISTORY_DB or '未启用'})")
+    where, args = ["ts >= ?"], [int(time.time()) - a.days * 86400]
+    if a.account: where.append("(account = ? OR acct = ? OR acct = ?)"); args += [a.account, a.account, _session_key(a.account)]
+    if a.server: where.append("server = ?"); args.append(a.server)
+    if a.sid: where.append("sid = ?"); args.append(a.sid)
+    where = " AND ".join(where)
+    db = history_db()
+    # 旧记录没有 acct 列，退回脱敏邮箱分组
+    rows = db.execute(f"""
+        SELECT COALESCE(acct, account) AS who, sid, MAX(account), MAX(server), COUNT(*), SUM(kind = 'renew_success'),
+               SUM(kind = 'cooldown'), SUM(kind = 'maxed_out'), SUM(kind = 'renew_failed'), SUM(kind = 'error'),
+               SUM(CASE WHEN kind = 'renew_success' THEN after_h - before_h ELSE 0 END)
+        FROM runs WHERE {where} GROUP BY who, sid ORDER BY MAX(account), MAX(server)""", args).fetchall()
+    print(f"📊 最近 {a.days} 天续期统计")
+    print(f"{'账号/服务器':<28}{'ID':<10}{'轮次':>6}{'成功':>6}{'成功率':>8}{'冷却空跑':>8}{'已满':>6}{'未生效':>8}{'报错':>6}{'累计增加':>10}")
+    for who, sid, account, server, n, ok, cd, mx, fail, err, gained in rows:
+        # 成功率只算真正尝试了续期的轮次
+        tried = ok + fail
+        rate = f"{ok / tried * 100:.0f}%" if tried else "-"
+        label = f"{account or '?'}/{server or '?'}"
+        print(f"{label:<28}{(sid or '-')[:8]:<10}{n:>6}{ok:>6}{rate:>8}{cd:>8}{mx:>6}{fail:>8}{err:>6}{gained or 0:>9}h")
+    for who, sid, account, server, *_ in rows:
+        pts = db.execute(f"SELECT ts, before_h, after_h FROM runs WHERE {where} AND COALESCE(acct, account) IS ? AND sid IS ? "
+                         "AND before_h IS NOT NULL ORDER BY ts DESC LIMIT ?", args + [who, sid, a.trend]).fetchall()[::-1]
+        if not pts: continue
+        trend = "  ".join(f"{datetime.fromtimestamp(ts, ZoneInfo('Asia/Shanghai')).strftime('%m/%d %H:%M')} {b}→{b if af is None else af}h" for ts, b, af in pts)
+        print(f"\n⏰ {account}/{server} ({(sid or '-')[:8]}) 剩余小时: {trend}")
+    db.close()
+
+# ===== 守护模式: 按每台服务器下一次"有意义"的时间点排队，睡到最早那个再跑 =====
+STOP = threading.Event()
+
+def useful_at(r):
+    # 冷却结束 且 剩余时间跌破上限线，两者都满足续期才会生效；信息不足返回 None
+    cands = [parse_time(r.get("cooldown_until"))]
+    expiry = parse_time(r.get("expiry"))
+    if expiry: cands.append(expiry - timedelta(hours=MAXED_HOURS))
+    cands = [t for t in cands if t]
+    return max(cands) if cands else None
+
+def next_action_at(r, fails=0):
+    # 返回 (下次时间, 是否属于重试)；报错或有用时间已过(续期未生效/冷却解析不出)按失败次数指数退避
+    # 续期成功不算失败: 冷却已知就等冷却，否则按基础重试间隔再看一次，连续失败计数清零
+    now = datetime.now(timezone.utc)
+    when = useful_at(r) if r.get("kind") != "error" else None
+    if r.get("kind") == "renew_success":
+        cooldown = timedelta(minutes=RENEW_COOLDOWN_MIN or DAEMON_RETRY_MIN)
+        when, retry = max(when or now, now + cooldown), False
+    else:
+        retry = not when or when <= now
+    if retry:
+        when = now + timedelta(minutes=min(DAEMON_RETRY_MIN * 2 ** fails, DAEMON_MAX_SLEEP_H * 60))
+    else:
+        when += timedelta(seconds=DAEMON_MARGIN_S)
+    when = min(when, now + timedelta(hours=DAEMON_MAX_SLEEP_H))
+    # 抖动放在截断之后，否则到期/上限两端的账号会挤到同一秒
+    return when + timedelta(seconds=random.uniform(0, DAEMON_JITTER_S)), retry
+
+def daemon():
+    accounts = load_accounts()
+    heap = [(datetime.now(timezone.utc), i) for i in range(len(accounts))]
+    heapq.heapify(heap)
+    fails = [0] * len(accounts)
+    signal.signal(signal.SIGTERM, lambda *_: STOP.set())
+    if STATUS_PORT: serve_status(STATUS_PORT)
+    print(f"🕰️ 守护模式启动: {len(accounts)} 个账号")
+    while heap and not STOP.is_set():
+        when, i = heapq.heappop(heap)
+        delay = (when - datetime.now(timezone.utc)).total_seconds()
+        if delay > 0:
+            print(f"💤 下一次: {mask_email(accounts[i]['email'])} @ {when.astimezone(ZoneInfo('Asia/Shanghai')).strftime('%m/%d %H:%M:%S')} ({delay/60:.0f} 分钟后)")
+            if STOP.wait(delay): break
+        # 同一时刻到期的账号一起跑，沿用并发池
+        due = [i]
+        while heap and heap[0][0] <= datetime.now(timezone.utc): due.append(heapq.heappop(heap)[1])
+        batch = []
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(due)))) as pool:
+            for j, rs in zip(due, pool.map(run_account, [accounts[k] for k in due])):
+                nxt, retry = min(next_action_at(r, fails[j]) for r in rs or [{"kind": "error"}])
+                fails[j] = fails[j] + 1 if retry else 0
+                heapq.heappush(heap, (nxt, j))
+                batch += rs
+        # 两批之间可能要睡好几个小时，共享 Chrome 不留着占内存，下一批按需重启
+        HOST.shutdown()
+        finish_run(batch)
+        METRICS.reset()
+    print("🛑 守护模式退出")
+
 if __name__ == "__main__":
-    run()
+    mode = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if mode == "daemon": daemon()
+    elif mode == "history": history_cli(sys.argv[2:])
+    elif mode == "serve":
+        # 只读状态服务: 续期由 cron/工作流另行运行，这里跟着状态文件刷新
+        serve_status(STATUS_PORT or 9108)
+        signal.signal(signal.SIGTERM, lambda *_: STOP.set())
+        try: STOP.wait()
+        except KeyboardInterrupt: pass
+    else: run()
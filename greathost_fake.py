@@ -0,0 +1,177 @@
+##### greathost_fake.py 本地 GreatHost 替身站点，供压测/回归使用 ######
+# 用法: python greathost_fake.py --port 8765 --servers 3 --latency-ms 80 --cooldown-min 30
+# 然后 GREATHOST_URL=http://127.0.0.1:8765 IP_URL=http://127.0.0.1:8765/ip python greathost.py
+
+import re, json, time, uuid, random, argparse, threading
+from datetime import datetime, timezone, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+LOGIN_HTML = """<!doctype html><html><body>
+<form method="post" action="/login">
+  <input name="email" type="email"><input name="password" type="password">
+  <button type="submit">Login</button>
+</form></body></html>"""
+
+DASHBOARD_HTML = "<!doctype html><html><body><h1>Dashboard</h1></body></html>"
+
+# 按钮文字延迟填充，模拟真实站点的异步渲染
+CONTRACT_HTML = """<!doctype html><html><body>
+<button id="renew-free-server-btn"></button>
+<script>setTimeout(() => document.getElementById('renew-free-server-btn').textContent = %s, %d);</script>
+</body></html>"""
+
+def iso(t):
+    return t.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+class FakeSite:
+    def __init__(self, servers=1, names=None, hours=80, renew_h=12, cap_h=120, cooldown_min=30,
+                 expose_cooldown=False, latency_ms=0, jitter_ms=0, fail_rate=0.0, btn_delay_ms=300,
+                 email="", password="", status="running"):
+        now = datetime.now(timezone.utc)
+        names = names or ["loveMC"] + [f"srv{i}" for i in range(1, servers)]
+        self.servers = {str(uuid.uuid4()): {"name": n, "expiry": now + timedelta(hours=hours), "last": None, "status": status}
+                        for n in names[:max(servers, 1)]}
+        self.renew_h, self.cap_h, self.cooldown = renew_h, cap_h, timedelta(minutes=cooldown_min)
+        self.expose_cooldown, self.fail_rate, self.btn_delay_ms = expose_cooldown, fail_rate, btn_delay_ms
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.email, self.password = email, password
+        self.sessions, self.hits = set(), {}
+        self.lock = threading.Lock()
+
+    def cooldown_until(self, srv):
+        return srv["last"] + self.cooldown if srv["last"] else None
+
+    def renewal_info(self, srv):
+        info = {"nextRenewalDate": iso(srv["expiry"])}
+        if srv["last"]: info["lastRenewalDate"] = iso(srv["last"])
+        until = self.cooldown_until(srv)
+        if self.expose_cooldown:
+            info["cooldownUntil"] = iso(until) if until else None
+            info["canRenew"] = not until or until <= datetime.now(timezone.utc)
+        return info
+
+    def renew(self, srv):
+        now = datetime.now(timezone.utc)
+        until = self.cooldown_until(srv)
+        if until and until > now:
+            return {"success": False, "message": f"Wait {int((until - now).total_seconds() // 60) + 1} minutes"}
+        if srv["expiry"] + timedelta(hours=self.renew_h) - now > timedelta(hours=self.cap_h):
+            return {"success": False, "message": "No puedes renovar más de 5 días"}
+        srv["expiry"] += timedelta(hours=self.renew_h)
+        srv["last"] = now
+        return {"success": True, "message": "Servidor gratuito renovado correctamente", "details": {"nextRenewalDate": iso(srv["expiry"])}}
+
+    def button_text(self, srv):
+        now = datetime.now(timezone.utc)
+        until = self.cooldown_until(srv)
+        return f"Wait {int((until - now).total_seconds() // 60) + 1} minutes" if until and until > now else "Renew Free Server"
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True # 头和 body 分两次写，不关 Nagle 会白等 40ms 延迟 ACK
+
+        def log_message(self, *args): pass
+
+        def _send(self, code, body, ctype="application/json", headers=None):
+            data = (json.dumps(body) if ctype == "application/json" else body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", f"{ctype}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items(): self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _redirect(self, to, headers=None):
+            self.send_response(302)
+            self.send_header("Location", to)
+            self.send_header("Content-Length", "0")
+            for k, v in (headers or {}).items(): self.send_header(k, v)
+            self.end_headers()
+
+        def _authed(self):
+            m = re.search(r"gh_session=([\w-]+)", self.headers.get("Cookie", ""))
+            return bool(m and m.group(1) in site.sessions)
+
+        def _route(self, method):
+            path = urlparse(self.path).path
+            key = f"{method} {re.sub(r'[0-9a-f-]{36}', '{sid}', path)}"
+            with site.lock: site.hits[key] = site.hits.get(key, 0) + 1
+            if site.latency_ms or site.jitter_ms:
+                time.sleep((site.latency_ms + random.uniform(0, site.jitter_ms)) / 1000)
+
+            if path == "/ip": return self._send(200, {"ip": self.client_address[0]})
+            if path == "/favicon.ico": return self._send(204, "", "image/x-icon")
+            if path == "/login" and method == "GET": return self._send(200, LOGIN_HTML, "text/html")
+            if path == "/login" and method == "POST":
+                form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode())
+                email, pw = form.get("email", [""])[0], form.get("password", [""])[0]
+                if (site.email and email != site.email) or (site.password and pw != site.password):
+                    return self._send(401, LOGIN_HTML, "text/html")
+                token = uuid.uuid4().hex
+                site.sessions.add(token)
+                return self._redirect("/dashboard", {"Set-Cookie": f"gh_session={token}; Path=/; HttpOnly; Max-Age=86400"})
+
+            if not self._authed():
+                return self._send(401, {"success": False, "message": "Unauthorized"}) if path.startswith("/api/") else self._redirect("/login")
+            if path.startswith("/api/") and site.fail_rate and random.random() < site.fail_rate:
+                return self._send(500, {"success": False, "message": "injected failure"})
+
+            if path == "/dashboard": return self._send(200, DASHBOARD_HTML, "text/html")
+            if path == "/api/servers":
+                return self._send(200, {"servers": [{"id": sid, "name": s["name"]} for sid, s in site.servers.items()]})
+            m = re.fullmatch(r"/(api/servers|api/renewal/contracts|contracts)/([0-9a-f-]{36})(/[\w-]+)?", path)
+            srv = site.servers.get(m.group(2)) if m else None
+            if not srv: return self._send(404, {"success": False, "message": "Not found"})
+            kind, tail = m.group(1), m.group(3)
+            if kind == "contracts":
+                return self._send(200, CONTRACT_HTML % (json.dumps(site.button_text(srv)), site.btn_delay_ms), "text/html")
+            if kind == "api/servers" and tail == "/information":
+                return self._send(200, {"status": srv["status"], "name": srv["name"]})
+            if kind == "api/renewal/contracts" and not tail:
+                return self._send(200, {"contract": {"renewalInfo": site.renewal_info(srv)}})
+            if kind == "api/renewal/contracts" and tail == "/renew-free" and method == "POST":
+                with site.lock: return self._send(200, site.renew(srv))
+            return self._send(404, {"success": False, "message": "Not found"})
+
+        def do_GET(self): self._route("GET")
+        def do_POST(self): self._route("POST")
+
+    return Handler
+
+def serve(site, host="127.0.0.1", port=0):
+    # port=0 时由系统分配，返回 (server, base_url)，在后台线程运行
+    httpd = ThreadingHTTPServer((host, port), make_handler(site))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="greathost-fake", daemon=True).start()
+    return httpd, f"http://{host}:{httpd.server_address[1]}"
+
+def add_args(p):
+    p.add_argument("--servers", type=int, default=1, help="服务器数量")
+    p.add_argument("--hours", type=float, default=80, help="初始剩余小时")
+    p.add_argument("--renew-h", type=float, default=12, help="每次续期增加小时")
+    p.add_argument("--cap-h", type=float, default=120, help="累计上限小时")
+    p.add_argument("--cooldown-min", type=float, default=30, help="续期冷却分钟")
+    # 真实站点是否返回冷却字段未经证实，默认和真实站点一样只能读按钮
+    p.add_argument("--expose-cooldown", action="store_true", help="合同 JSON 返回推测的 cooldownUntil/canRenew (配合 COOLDOWN_FROM_API=1)")
+    p.add_argument("--latency-ms", type=float, default=0, help="每个请求固定延迟")
+    p.add_argument("--jitter-ms", type=float, default=0, help="额外随机延迟上限")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="API 随机 500 概率")
+    return p
+
+def site_from_args(a):
+    return FakeSite(servers=a.servers, hours=a.hours, renew_h=a.renew_h, cap_h=a.cap_h, cooldown_min=a.cooldown_min,
+                    expose_cooldown=a.expose_cooldown, latency_ms=a.latency_ms, jitter_ms=a.jitter_ms, fail_rate=a.fail_rate)
+
+if __name__ == "__main__":
+    p = add_args(argparse.ArgumentParser(description="本地 GreatHost 替身站点"))
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    a = p.parse_args()
+    httpd, url = serve(site_from_args(a), a.host, a.port)
+    print(f"🧪 GreatHost 替身站点: {url}  (GREATHOST_URL={url} IP_URL={url}/ip)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()